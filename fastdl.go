@@ -11,12 +11,16 @@ import (
 	"database/sql"
 	"encoding/hex"
 	"encoding/json"
+	"errors"
 	"flag"
 	"fmt"
+	"hash"
 	"io"
 	"log"
+	"math/rand"
 	"net"
 	"net/http"
+	"net/http/httptrace"
 	"net/url"
 	"os"
 	"os/signal"
@@ -30,6 +34,7 @@ import (
 	"sync/atomic"
 	"syscall"
 	"time"
+	"unsafe"
 
 	_ "github.com/mattn/go-sqlite3"
 	"golang.org/x/crypto/ssh/terminal"
@@ -40,11 +45,17 @@ import (
 const (
 	Version        = "5.0.0"
 	DefaultChunks  = 32
-	ChunkSize      = 4 * 1024 * 1024 // 4MB
-	BufferSize     = 32 * 1024       // 32KB
+	ChunkSize      = 4 * 1024 * 1024  // 4MB
+	MaxChunkSize   = 64 * 1024 * 1024 // 64MB
+	ChunksPerConn  = 4
+	BufferSize     = 256 * 1024  // 256KB
+	WriteBuffer    = 1024 * 1024 // 1MB
+	DirectAlign    = 4096        // offset and length alignment for direct I/O
 	MaxRetries     = 5
 	RetryDelay     = 2 * time.Second
-	ProgressUpdate = 100 * time.Millisecond
+	MaxRetryDelay  = 30 * time.Second
+	ProgressUpdate = 250 * time.Millisecond
+	RangeDuration  = 2 * time.Second // target transfer time of one range once a host's speed is known
 )
 
 var (
@@ -52,6 +63,9 @@ var (
 	globalConfig *Config
 	jobQueue *JobQueue
 	daemon *DaemonServer
+
+	errReadStalled  = errors.New("connection stalled: no data received before timeout")
+	errRangeIgnored = errors.New("server ignored the range request")
 )
 
 // Color codes for terminal output
@@ -88,6 +102,8 @@ type Config struct {
 	DaemonPort       int               `json:"daemon_port"`
 	DatabasePath     string            `json:"database_path"`
 	EnableHTTP2      bool              `json:"enable_http2"`
+	DirectIO         bool              `json:"direct_io"`
+	SocketBuffer     int               `json:"socket_buffer_bytes"`
 	EnableTUI        bool              `json:"enable_tui"`
 	MaxParallel      int               `json:"max_parallel_downloads"`
 	TorrentPort      int               `json:"torrent_port"`
@@ -107,6 +123,15 @@ type DownloadManager struct {
 	rateLimiter  *RateLimiter
 	proxyManager *ProxyManager
 	config       *Config
+	probes       sync.Map // URL -> fileProbe, made ahead and used once
+	hostRates    sync.Map // host -> per-connection bytes/sec seen on the last download
+}
+
+// fileProbe is what GetFileInfo learned about a URL
+type fileProbe struct {
+	size          int64
+	supportsRange bool
+	proto         string
 }
 
 // Job represents a download job
@@ -155,6 +180,7 @@ type DownloadTask struct {
 	Downloaded    int64
 	Chunks        int
 	SupportsRange bool
+	Protocol      string
 	StartTime     time.Time
 	Headers       map[string]string
 	Cookies       []*http.Cookie
@@ -165,17 +191,69 @@ type ChunkInfo struct {
 	ID    int
 	Start int64
 	End   int64
-	Path  string
+}
+
+// chunkPlan splits size bytes into count ranges of unit bytes, the last one
+// taking the remainder. Ranges are computed from their index when needed,
+// so a plan is the same three numbers however many ranges it has.
+type chunkPlan struct {
+	size  int64
+	unit  int64
+	count int
+}
+
+// chunkQueue hands out the ranges of a download plan in order and adds up
+// how fast the workers get through them
+type chunkQueue struct {
+	plan  chunkPlan
+	next  atomic.Int64
+	bytes atomic.Int64
+	nanos atomic.Int64
+}
+
+// RangeResponse is a range request whose headers have arrived
+type RangeResponse struct {
+	chunk ChunkInfo
+	resp  *http.Response
+	ctx   context.Context
+	stall *stallWatch
+	stop  func()
+	err   error
+}
+
+// ResumeState persists completed chunks of a parallel download
+type ResumeState struct {
+	Size   int64    `json:"size"`
+	Unit   int64    `json:"unit"`
+	Chunks int      `json:"chunks"`
+	Done   []uint64 `json:"done"` // bit i is set once chunk i is written
+	path   string
+	mu     sync.Mutex
+
+	frontier int // chunks before it are all written
 }
 
 // ProgressInfo for real-time updates
 type ProgressInfo struct {
-	Downloaded int64
+	// Every worker adds to Downloaded and reads lastRender on each flush.
+	// Active changes as ranges start and finish, so it gets its own line
+	Downloaded atomic.Int64
+	lastRender atomic.Int64 // nanoseconds since started, claimed by the goroutine that redraws
+	_          [48]byte
+	Active     atomic.Int32
+	_          [60]byte
+
 	Total      int64
 	Speed      float64
 	Percentage float64
-	Active     int32
 	ETA        time.Duration
+
+	started      time.Time
+	invTotal     float64 // 100/Total, or 0 when the size is unknown
+	renderMu     sync.Mutex
+	renderedAt   time.Duration
+	renderedSize int64
+	line         []byte
 }
 
 // RateLimiter implements bandwidth throttling
@@ -186,6 +264,19 @@ type RateLimiter struct {
 	mu       sync.RWMutex
 }
 
+// stallWatch aborts a transfer when the server stops sending data
+type stallWatch struct {
+	timer   *time.Timer
+	timeout time.Duration
+}
+
+// statusError is an unexpected HTTP status, along with any delay the
+// server asked for before the next attempt
+type statusError struct {
+	code       int
+	retryAfter time.Duration
+}
+
 // ProxyManager handles proxy configuration
 type ProxyManager struct {
 	proxyURL *url.URL
@@ -211,6 +302,7 @@ type JobQueue struct {
 	mu         sync.RWMutex
 	db         *sql.DB
 	stopCh     chan struct{}
+	wakeCh     chan struct{} // signalled whenever a job is queued or a slot frees up
 	wg         sync.WaitGroup
 	manager    *DownloadManager
 }
@@ -266,6 +358,15 @@ func (rl *RateLimiter) Wait(ctx context.Context, bytes int) error {
 	}
 	rl.mu.RLock()
 	defer rl.mu.RUnlock()
+	// WaitN rejects requests larger than the burst, so reads bigger than
+	// one second's allowance are paid for in burst-sized pieces
+	burst := rl.limiter.Burst()
+	for bytes > burst {
+		if err := rl.limiter.WaitN(ctx, burst); err != nil {
+			return err
+		}
+		bytes -= burst
+	}
 	return rl.limiter.WaitN(ctx, bytes)
 }
 
@@ -301,8 +402,12 @@ func (p *ProxyManager) GetTransport() *http.Transport {
 	transport := &http.Transport{
 		MaxIdleConns:        100,
 		MaxIdleConnsPerHost: 100,
-		IdleConnTimeout:     90 * time.Second,
-		DisableCompression:  true,
+		IdleConnTimeout:     120 * time.Second,
+		// Byte ranges and Content-Length refer to the raw body, never decompress
+		DisableCompression: true,
+		// The default 4KB connection buffer splits every body read into
+		// many small socket reads; match it to the body read size instead
+		ReadBufferSize: BufferSize,
 		TLSClientConfig: &tls.Config{
 			InsecureSkipVerify: false,
 		},
@@ -340,13 +445,64 @@ func NewDownloadManager(config *Config) (*DownloadManager, error) {
 	}
 
 	transport := proxyManager.GetTransport()
+	// A batch can hold MaxConnections ranges open for each of MaxParallel
+	// files on the same host. Keep that many idle connections per host, so
+	// the next file starts on warm connections instead of new handshakes.
+	// The total stays capped at a few hosts' worth, so a batch spanning
+	// many hosts does not keep sockets open to each until they time out.
+	transport.MaxIdleConnsPerHost = max(transport.MaxIdleConnsPerHost, config.MaxConnections*max(config.MaxParallel, 1))
+	transport.MaxIdleConns = max(transport.MaxIdleConns, 4*transport.MaxIdleConnsPerHost)
+
+	// With HTTP/2 every range of a file becomes a stream on one shared
+	// connection, so a download pays for a single TCP and TLS handshake.
+	// Servers that only negotiate HTTP/1.1 through ALPN keep using one
+	// connection per range.
 	if config.EnableHTTP2 {
-		http2.ConfigureTransport(transport)
+		h2, err := http2.ConfigureTransports(transport)
+		if err != nil {
+			return nil, err
+		}
+		// Bodies arrive in far fewer frames than with the 16KB default
+		h2.MaxReadFrameSize = 1 << 20
+		// One dead connection would stall every stream, so probe it with
+		// a ping once it goes quiet instead of waiting for the stall timer
+		h2.ReadIdleTimeout = 30 * time.Second
+		h2.PingTimeout = 15 * time.Second
+		// Never exceed the server's SETTINGS_MAX_CONCURRENT_STREAMS: ranges
+		// beyond it wait for a stream to finish rather than dialing extra
+		// connections to the same host
+		h2.StrictMaxConcurrentStreams = true
+	}
+
+	// Time out each phase of a request rather than the request as a whole:
+	// a total client timeout would abort any download that takes longer
+	// than Timeout, no matter how healthy the transfer is
+	timeout := time.Duration(config.Timeout) * time.Second
+	dialer := &net.Dialer{
+		Timeout:   timeout,
+		KeepAlive: 30 * time.Second,
+		// Start the IPv4 attempt sooner when IPv6 is slow to connect
+		FallbackDelay: 100 * time.Millisecond,
+	}
+	transport.DialContext = func(ctx context.Context, network, addr string) (net.Conn, error) {
+		conn, err := dialer.DialContext(ctx, network, addr)
+		if err != nil {
+			return nil, err
+		}
+		// Go already disables Nagle on TCP connections. A fixed receive
+		// buffer turns off the kernel's autotuning and is capped by
+		// net.core.rmem_max, so it is only set when configured, for hosts
+		// whose limits allow a wider window than autotuning reaches
+		if tcp, ok := conn.(*net.TCPConn); ok && config.SocketBuffer > 0 {
+			tcp.SetReadBuffer(config.SocketBuffer)
+		}
+		return conn, nil
 	}
+	transport.TLSHandshakeTimeout = timeout
+	transport.ResponseHeaderTimeout = timeout
 
 	client := &http.Client{
 		Transport: transport,
-		Timeout:   time.Duration(config.Timeout) * time.Second,
 	}
 
 	return &DownloadManager{
@@ -361,51 +517,154 @@ func NewDownloadManager(config *Config) (*DownloadManager, error) {
 	}, nil
 }
 
+// watchStalls derives a context that is cancelled when the stall watch fires.
+// The watch starts armed to cover the request itself; the body loop arms it
+// around each read so that slow rate-limited waits never count as a stall.
+func (dm *DownloadManager) watchStalls(ctx context.Context) (context.Context, *stallWatch, func()) {
+	ctx, cancel := context.WithCancelCause(ctx)
+	watch := &stallWatch{timeout: time.Duration(dm.config.Timeout) * time.Second}
+	if watch.timeout > 0 {
+		watch.timer = time.AfterFunc(watch.timeout, func() { cancel(errReadStalled) })
+	}
+	return ctx, watch, func() {
+		watch.Disarm()
+		cancel(nil)
+	}
+}
+
+func (w *stallWatch) Arm() {
+	if w.timer != nil {
+		w.timer.Reset(w.timeout)
+	}
+}
+
+func (w *stallWatch) Disarm() {
+	if w.timer != nil {
+		w.timer.Stop()
+	}
+}
+
 // GetFileInfo retrieves file information from URL
 func (dm *DownloadManager) GetFileInfo(ctx context.Context, urlStr string) (*DownloadTask, error) {
-	req, err := http.NewRequestWithContext(ctx, "HEAD", urlStr, nil)
+	task := &DownloadTask{
+		URL:       urlStr,
+		StartTime: time.Now(),
+		Headers:   dm.config.Headers,
+	}
+
+	parsedURL, err := url.Parse(urlStr)
 	if err != nil {
 		return nil, err
 	}
+	task.Filepath = path.Base(parsedURL.Path)
+	if task.Filepath == "" || task.Filepath == "/" || task.Filepath == "." {
+		task.Filepath = fmt.Sprintf("download_%d", time.Now().Unix())
+	}
 
-	req.Header.Set("User-Agent", dm.config.UserAgent)
-	for k, v := range dm.config.Headers {
-		req.Header.Set(k, v)
+	if parsedURL.Scheme == "file" {
+		info, err := os.Stat(parsedURL.Path)
+		if err != nil {
+			return nil, err
+		}
+		task.Size, task.Protocol = info.Size(), "file"
+		return task, nil
 	}
 
-	resp, err := dm.client.Do(req)
-	if err != nil {
+	// A probe made ahead of time by a batch is used once and dropped, so a
+	// later download of the same URL sees the file as it is then
+	var probe fileProbe
+	if cached, ok := dm.probes.LoadAndDelete(urlStr); ok {
+		probe = cached.(fileProbe)
+	} else if probe, err = dm.probeURL(ctx, urlStr); err != nil {
 		return nil, err
 	}
-	defer resp.Body.Close()
 
-	if resp.StatusCode != http.StatusOK && resp.StatusCode != http.StatusPartialContent {
-		return nil, fmt.Errorf("server returned %d", resp.StatusCode)
+	task.Size, task.SupportsRange, task.Protocol = probe.size, probe.supportsRange, probe.proto
+	return task, nil
+}
+
+// probeURL asks the server for the size and range support of urlStr
+func (dm *DownloadManager) probeURL(ctx context.Context, urlStr string) (fileProbe, error) {
+	probe, headErr := dm.probeHead(ctx, urlStr)
+
+	// Some servers refuse HEAD, omit Content-Length, or serve ranges without
+	// advertising them. A one-byte ranged GET settles it, but only when the
+	// answer could make the download parallel
+	if headErr != nil || probe.size <= 0 || (!probe.supportsRange && probe.size >= 2*dm.minChunkSize()) {
+		if ranged, err := dm.probeRange(ctx, urlStr); err == nil {
+			if ranged.size <= 0 {
+				ranged.size = probe.size
+			}
+			probe, headErr = ranged, nil
+		}
 	}
+	if headErr != nil {
+		return fileProbe{}, headErr
+	}
+	return probe, nil
+}
 
-	task := &DownloadTask{
-		URL:       urlStr,
-		StartTime: time.Now(),
-		Headers:   dm.config.Headers,
+// probeHead reads size and range support from a HEAD request
+func (dm *DownloadManager) probeHead(ctx context.Context, urlStr string) (fileProbe, error) {
+	resp, err := dm.probe(ctx, "HEAD", urlStr, "")
+	if err != nil {
+		return fileProbe{}, err
+	}
+	resp.Body.Close()
+
+	if resp.StatusCode != http.StatusOK && resp.StatusCode != http.StatusPartialContent {
+		return fileProbe{}, newStatusError(resp)
 	}
 
+	probe := fileProbe{proto: resp.Proto}
 	if contentLength := resp.Header.Get("Content-Length"); contentLength != "" {
-		task.Size, _ = strconv.ParseInt(contentLength, 10, 64)
+		probe.size, _ = strconv.ParseInt(contentLength, 10, 64)
 	}
+	probe.supportsRange = resp.Header.Get("Accept-Ranges") == "bytes"
+	return probe, nil
+}
 
-	if acceptRanges := resp.Header.Get("Accept-Ranges"); acceptRanges == "bytes" {
-		task.SupportsRange = true
+// probeRange requests the first byte of the file. A 206 proves range support
+// and its Content-Range carries the full size; a 200 means ranges are ignored.
+func (dm *DownloadManager) probeRange(ctx context.Context, urlStr string) (fileProbe, error) {
+	resp, err := dm.probe(ctx, "GET", urlStr, "bytes=0-0")
+	if err != nil {
+		return fileProbe{}, err
 	}
+	defer resp.Body.Close()
 
-	if task.Filepath == "" {
-		parsedURL, _ := url.Parse(urlStr)
-		task.Filepath = path.Base(parsedURL.Path)
-		if task.Filepath == "" || task.Filepath == "/" {
-			task.Filepath = fmt.Sprintf("download_%d", time.Now().Unix())
+	switch resp.StatusCode {
+	case http.StatusPartialContent:
+		probe := fileProbe{supportsRange: true, proto: resp.Proto}
+		// Content-Range: bytes 0-0/12345, where the total may be "*"
+		contentRange := resp.Header.Get("Content-Range")
+		if i := strings.LastIndexByte(contentRange, '/'); i >= 0 {
+			probe.size, _ = strconv.ParseInt(contentRange[i+1:], 10, 64)
 		}
+		return probe, nil
+	case http.StatusOK:
+		return fileProbe{size: resp.ContentLength, proto: resp.Proto}, nil
+	default:
+		return fileProbe{}, newStatusError(resp)
 	}
+}
 
-	return task, nil
+// probe sends a metadata request with the configured headers
+func (dm *DownloadManager) probe(ctx context.Context, method, urlStr, byteRange string) (*http.Response, error) {
+	req, err := http.NewRequestWithContext(ctx, method, urlStr, nil)
+	if err != nil {
+		return nil, err
+	}
+
+	req.Header.Set("User-Agent", dm.config.UserAgent)
+	if byteRange != "" {
+		req.Header.Set("Range", byteRange)
+	}
+	for k, v := range dm.config.Headers {
+		req.Header.Set(k, v)
+	}
+
+	return dm.client.Do(req)
 }
 
 // Download performs the main download operation
@@ -418,32 +677,58 @@ func (dm *DownloadManager) Download(ctx context.Context, task *DownloadTask) err
 	if task.Size == 0 {
 		task.Size = info.Size
 	}
+	if task.Filepath == "" {
+		task.Filepath = info.Filepath
+	}
+	if task.StartTime.IsZero() {
+		task.StartTime = info.StartTime
+	}
 	task.SupportsRange = info.SupportsRange
+	task.Protocol = info.Protocol
 
 	outputPath := filepath.Join(dm.downloadDir, task.Filepath)
 	if err := os.MkdirAll(filepath.Dir(outputPath), 0755); err != nil {
 		return fmt.Errorf("failed to create directory: %w", err)
 	}
 
-	fmt.Printf("%sDownloading:%s %s\n", ColorGreen, ColorReset, task.URL)
-	fmt.Printf("%sOutput:%s %s\n", ColorCyan, ColorReset, outputPath)
-	fmt.Printf("%sSize:%s %s\n", ColorCyan, ColorReset, formatBytes(task.Size))
-	fmt.Printf("%sRange Support:%s %v\n", ColorCyan, ColorReset, task.SupportsRange)
-	fmt.Printf("%sConnections:%s %d\n\n", ColorCyan, ColorReset, task.Chunks)
+	// Write the header in one piece so lines from parallel batch
+	// downloads do not interleave and redirected output costs one write
+	header := fmt.Appendf(nil, "%sDownloading:%s %s\n", ColorGreen, ColorReset, task.URL)
+	header = fmt.Appendf(header, "%sOutput:%s %s\n", ColorCyan, ColorReset, outputPath)
+	header = fmt.Appendf(header, "%sSize:%s %s\n", ColorCyan, ColorReset, formatBytes(task.Size))
+	header = fmt.Appendf(header, "%sRange Support:%s %v\n", ColorCyan, ColorReset, task.SupportsRange)
+	header = fmt.Appendf(header, "%sProtocol:%s %s\n", ColorCyan, ColorReset, task.Protocol)
+	workers := dm.rangeWorkers(task.Protocol)
+	if strings.HasPrefix(task.Protocol, "HTTP/2") {
+		header = fmt.Appendf(header, "%sConnections:%s %d streams on one connection\n\n", ColorCyan, ColorReset, workers)
+	} else {
+		header = fmt.Appendf(header, "%sConnections:%s %d (%d ranges at a time, each opening the next before it ends)\n\n", ColorCyan, ColorReset, 2*workers, workers)
+	}
+	os.Stdout.Write(header)
 
-	progress := &ProgressInfo{Total: task.Size}
-	progressDone := make(chan bool)
-	go dm.reportProgress(ctx, task, progress, progressDone)
+	progress := NewProgressInfo(task.Size)
 
 	var downloadErr error
 	
-	if task.SupportsRange && task.Chunks > 1 && task.Size > 0 {
+	switch {
+	case task.Protocol == "file":
+		downloadErr = dm.copyLocal(ctx, task, outputPath, progress)
+	// Files too small to give two connections a minimum-sized chunk each
+	// finish faster as a single stream than with range coordination
+	case task.SupportsRange && task.Chunks > 1 && task.Size >= 2*dm.minChunkSize():
 		downloadErr = dm.downloadParallel(ctx, task, outputPath, progress)
-	} else {
+		if errors.Is(downloadErr, errRangeIgnored) {
+			fmt.Printf("%sServer ignored the range request, downloading as a single stream%s\n", ColorYellow, ColorReset)
+			progress.Downloaded.Store(0)
+			downloadErr = dm.downloadSingle(ctx, task, outputPath, progress)
+		}
+	default:
 		downloadErr = dm.downloadSingle(ctx, task, outputPath, progress)
 	}
 
-	close(progressDone)
+	if stdoutIsTerminal {
+		progress.Render()
+	}
 	
 	if downloadErr != nil {
 		return downloadErr
@@ -464,184 +749,743 @@ func (dm *DownloadManager) Download(ctx context.Context, task *DownloadTask) err
 	return nil
 }
 
+// copyLocal copies a file:// source, for mirrors on local or shared storage.
+// Copying between two files lets the kernel move the data itself
+// (copy_file_range on Linux) instead of passing it through user space; it
+// goes in MaxChunkSize steps so progress, rate limits and cancellation
+// still apply.
+func (dm *DownloadManager) copyLocal(ctx context.Context, task *DownloadTask, outputPath string, progress *ProgressInfo) error {
+	parsedURL, err := url.Parse(task.URL)
+	if err != nil {
+		return err
+	}
+	src, err := os.Open(parsedURL.Path)
+	if err != nil {
+		return err
+	}
+	defer src.Close()
+
+	// Downloading into the source's own directory resolves the output to
+	// the source itself; copying would truncate it
+	srcInfo, err := src.Stat()
+	if err != nil {
+		return err
+	}
+	if dstInfo, err := os.Stat(outputPath); err == nil && os.SameFile(srcInfo, dstInfo) {
+		return fmt.Errorf("source and destination are the same file: %s", outputPath)
+	}
+
+	// Copy into a .part file so a failed copy never leaves a truncated
+	// file at the final path
+	partPath := outputPath + ".part"
+	dst, err := os.Create(partPath)
+	if err != nil {
+		return err
+	}
+	defer dst.Close()
+
+	for {
+		if err := ctx.Err(); err != nil {
+			return err
+		}
+		n, err := io.CopyN(dst, src, MaxChunkSize)
+		if n > 0 {
+			if dm.rateLimiter != nil {
+				dm.rateLimiter.Wait(ctx, int(n))
+			}
+			progress.Add(n)
+		}
+		if err == io.EOF {
+			break
+		}
+		if err != nil {
+			return err
+		}
+	}
+
+	if err := dst.Close(); err != nil {
+		return err
+	}
+	return os.Rename(partPath, outputPath)
+}
+
 // downloadParallel handles multi-threaded downloads
 func (dm *DownloadManager) downloadParallel(ctx context.Context, task *DownloadTask, outputPath string, progress *ProgressInfo) error {
-	tempFile, err := os.Create(outputPath + ".tmp")
+	partPath := outputPath + ".part"
+
+	// Every range request is a clone of one prepared request, so the URL
+	// is parsed and the headers are built once per download
+	template, err := dm.newRequest(ctx, task)
+	if err != nil {
+		return err
+	}
+
+	host := template.URL.Host
+	var rate float64
+	if known, ok := dm.hostRates.Load(host); ok {
+		rate = known.(float64)
+	}
+	// Checked before the .part file is created, so a missing one is noticed
+	state, plan := openResumeState(partPath, task.Size, dm.planChunks(task.Size, task.Chunks, rate), dm.resume)
+
+	file, err := os.OpenFile(partPath, os.O_WRONLY|os.O_CREATE, 0644)
 	if err != nil {
 		return err
 	}
-	defer os.Remove(outputPath + ".tmp")
+	defer file.Close()
 
-	if err := tempFile.Truncate(task.Size); err != nil {
-		tempFile.Close()
+	if err := preallocate(file, task.Size); err != nil {
 		return err
 	}
-	tempFile.Close()
 
-	chunkSize := task.Size / int64(task.Chunks)
-	chunks := make([]ChunkInfo, task.Chunks)
-	
-	for i := 0; i < task.Chunks; i++ {
-		chunks[i] = ChunkInfo{
-			ID:    i,
-			Start: int64(i) * chunkSize,
-			Path:  fmt.Sprintf("%s.part%d", outputPath, i),
-		}
-		
-		if i == task.Chunks-1 {
-			chunks[i].End = task.Size - 1
+	var out io.WriterAt = file
+	if dm.config.DirectIO {
+		direct, err := openDirect(partPath)
+		if err != nil {
+			fmt.Printf("%sDirect I/O unavailable, using buffered writes: %v%s\n", ColorYellow, err, ColorReset)
 		} else {
-			chunks[i].End = chunks[i].Start + chunkSize - 1
+			defer direct.Close()
+			out = &directWriter{direct: direct, buffered: file}
 		}
 	}
 
+	// Workers pull ranges from a shared queue, so fast connections take more
+	// of the file while a slow one finishes its current range. A worker that
+	// gives up cancels the rest instead of letting them drain the queue.
+	workCtx, cancel := context.WithCancel(ctx)
+	defer cancel()
+
 	var wg sync.WaitGroup
-	chunkChan := make(chan ChunkInfo, len(chunks))
-	errorChan := make(chan error, len(chunks))
+	queue := &chunkQueue{plan: plan}
+	errorChan := make(chan error, plan.count)
+
+	advanced := make(chan struct{}, 1)
+	flushed := make(chan struct{})
+	go writeBehind(file, plan, state, state.Frontier(), advanced, flushed)
 	
-	for i := 0; i < dm.maxWorkers && i < task.Chunks; i++ {
+	for i := 0; i < dm.rangeWorkers(task.Protocol) && i < plan.count; i++ {
 		wg.Add(1)
-		go dm.downloadWorker(ctx, &wg, task, chunkChan, errorChan, progress)
-	}
-
-	for _, chunk := range chunks {
-		chunkChan <- chunk
+		go dm.downloadWorker(workCtx, cancel, &wg, template, out, state, advanced, queue, errorChan, progress)
 	}
-	close(chunkChan)
 
 	wg.Wait()
 	close(errorChan)
+	close(advanced)
+	<-flushed
+
+	// Later files from the same host are planned from what this one achieved
+	if rate := queue.Rate(); rate > 0 {
+		dm.hostRates.Store(host, rate)
+	}
 
 	for err := range errorChan {
 		if err != nil {
+			// The caller starts over with a single stream, so the ranges
+			// written so far cannot be reused
+			if errors.Is(err, errRangeIgnored) {
+				file.Close()
+				os.Remove(partPath)
+				state.Remove()
+			}
 			return err
 		}
 	}
+	if err := ctx.Err(); err != nil {
+		return err
+	}
+
+	// Catch pages that were still dirty when their range was dropped
+	dropPageCache(file, 0, task.Size)
+
+	if err := file.Close(); err != nil {
+		return err
+	}
+	state.Remove()
+
+	return os.Rename(partPath, outputPath)
+}
+
+// Take claims the next planned range. The plan is fixed before the workers
+// start, so claiming one is a single atomic add instead of a channel receive
+func (q *chunkQueue) Take() (ChunkInfo, bool) {
+	i := q.next.Add(1) - 1
+	if i >= int64(q.plan.count) {
+		return ChunkInfo{}, false
+	}
+	return q.plan.Chunk(int(i)), true
+}
+
+// Record adds a downloaded range to the throughput totals
+func (q *chunkQueue) Record(chunk ChunkInfo, elapsed time.Duration) {
+	q.bytes.Add(chunk.End - chunk.Start + 1)
+	q.nanos.Add(int64(elapsed))
+}
+
+// Rate is the average throughput of one connection, or 0 before any range
+// has completed
+func (q *chunkQueue) Rate() float64 {
+	nanos := q.nanos.Load()
+	if nanos <= 0 {
+		return 0
+	}
+	return float64(q.bytes.Load()) / time.Duration(nanos).Seconds()
+}
+
+// Chunk returns range i of the plan
+func (p chunkPlan) Chunk(i int) ChunkInfo {
+	chunk := ChunkInfo{
+		ID:    i,
+		Start: int64(i) * p.unit,
+		End:   int64(i+1)*p.unit - 1,
+	}
+	if i == p.count-1 {
+		chunk.End = p.size - 1
+	}
+	return chunk
+}
 
-	return dm.mergeChunks(outputPath, chunks)
+// rangeWorkers is how many ranges of a download are transferred at once.
+// A worker opens its next range before the current one ends, so over
+// HTTP/1.x it briefly holds two connections; half as many workers keep a
+// download within its connection budget, and the idle pool sized from it.
+// HTTP/2 ranges are streams on one connection.
+func (dm *DownloadManager) rangeWorkers(proto string) int {
+	if strings.HasPrefix(proto, "HTTP/2") {
+		return dm.maxWorkers
+	}
+	return max(dm.maxWorkers/2, 1)
 }
 
-// downloadWorker handles individual chunk downloads
-func (dm *DownloadManager) downloadWorker(ctx context.Context, wg *sync.WaitGroup, task *DownloadTask, chunks <-chan ChunkInfo, errors chan<- error, progress *ProgressInfo) {
+// minChunkSize is the smallest range worth giving its own connection
+func (dm *DownloadManager) minChunkSize() int64 {
+	if dm.config.ChunkSize > 0 {
+		return dm.config.ChunkSize
+	}
+	return ChunkSize
+}
+
+// planChunks splits a file into ChunksPerConn ranges per connection for the
+// workers to pull from. Small files get fewer ranges so none is smaller than
+// minChunkSize, and large files get more so none exceeds MaxChunkSize.
+// When rate, a connection's throughput to the host, is known, ranges are
+// sized to take RangeDuration each instead: fast links get ranges long
+// enough to keep the pipe full between requests, and slow ones get short
+// ranges that spread well across the connections.
+func (dm *DownloadManager) planChunks(size int64, connections int, rate float64) chunkPlan {
+	count := int64(connections) * ChunksPerConn
+	if rate > 0 {
+		unit := min(max(int64(rate*RangeDuration.Seconds()), dm.minChunkSize()), MaxChunkSize)
+		count = max((size+unit-1)/unit, int64(connections))
+	}
+	if maxCount := size / dm.minChunkSize(); count > maxCount {
+		count = maxCount
+	}
+	if count < 1 {
+		count = 1
+	}
+	if minCount := (size + MaxChunkSize - 1) / MaxChunkSize; count < minCount {
+		count = minCount
+	}
+
+	unit := size / count
+	// Direct I/O needs block-aligned offsets, so every range but the last
+	// must start on a block boundary
+	if dm.config.DirectIO && unit > DirectAlign {
+		unit -= unit % DirectAlign
+	}
+	return chunkPlan{size: size, unit: unit, count: int(count)}
+}
+
+// downloadWorker handles individual chunk downloads. Once the body of the
+// current range is nearly done it requests the next range, so that request's
+// round trip overlaps with the tail of the transfer instead of following it.
+func (dm *DownloadManager) downloadWorker(ctx context.Context, cancel context.CancelFunc, wg *sync.WaitGroup, template *http.Request, out io.WriterAt, state *ResumeState, advanced chan<- struct{}, queue *chunkQueue, errors chan<- error, progress *ProgressInfo) {
 	defer wg.Done()
 
-	for chunk := range chunks {
-		atomic.AddInt32(&progress.Active, 1)
-		
-		for retry := 0; retry < dm.config.MaxRetries; retry++ {
-			if err := dm.downloadChunk(ctx, task.URL, chunk, progress, task.Headers); err == nil {
-				break
-			} else if retry == dm.config.MaxRetries-1 {
-				errors <- fmt.Errorf("chunk %d failed after %d retries: %w", chunk.ID, dm.config.MaxRetries, err)
-				atomic.AddInt32(&progress.Active, -1)
+	attempts := dm.config.MaxRetries
+	if attempts < 1 {
+		attempts = 1
+	}
+	// One staging buffer serves every range this worker downloads, so
+	// memory stays at one buffer per connection however many ranges there are
+	staging := writeBuffers.Get().(*[]byte)
+	defer writeBuffers.Put(staging)
+	buffer := *staging
+
+	chunk, ok := dm.nextChunk(ctx, queue, state, progress)
+	var pending <-chan *RangeResponse
+	for ok {
+		var next ChunkInfo
+		var hasNext bool
+		var nextPending <-chan *RangeResponse
+		prefetched := false
+		prefetch := func() {
+			if prefetched {
 				return
 			}
-			time.Sleep(time.Duration(dm.config.RetryDelay) * time.Second)
+			prefetched = true
+			if next, hasNext = dm.nextChunk(ctx, queue, state, progress); hasNext {
+				nextPending = dm.openRangeAsync(ctx, template, next)
+			}
 		}
-		
-		atomic.AddInt32(&progress.Active, -1)
+
+		progress.Active.Add(1)
+		started := time.Now()
+
+		var err error
+		for retry := 0; retry < attempts; retry++ {
+			var r *RangeResponse
+			if pending != nil {
+				r = <-pending
+				pending = nil
+			} else {
+				r = dm.openRange(ctx, template, chunk)
+			}
+			if err = dm.downloadChunk(r, out, buffer, progress, prefetch); err == nil || ctx.Err() != nil || !retryable(err) {
+				break
+			}
+			if retry < attempts-1 && !sleepContext(ctx, dm.retryDelay(retry, err)) {
+				break
+			}
+		}
+
+		progress.Active.Add(-1)
+
+		if err != nil {
+			if ctx.Err() == nil {
+				if retryable(err) {
+					err = fmt.Errorf("chunk %d failed after %d retries: %w", chunk.ID, attempts, err)
+				} else {
+					err = fmt.Errorf("chunk %d failed: %w", chunk.ID, err)
+				}
+				errors <- err
+				cancel()
+			}
+			if nextPending != nil {
+				go func() { (<-nextPending).Close() }()
+			}
+			return
+		}
+
+		queue.Record(chunk, time.Since(started))
+		if state.MarkComplete(chunk.ID) {
+			select {
+			case advanced <- struct{}{}:
+			default: // a signal is already pending
+			}
+		}
+		prefetch()
+		chunk, ok, pending = next, hasNext, nextPending
 	}
 }
 
-// downloadChunk downloads a single chunk
-func (dm *DownloadManager) downloadChunk(ctx context.Context, urlStr string, chunk ChunkInfo, progress *ProgressInfo, headers map[string]string) error {
-	if dm.resume {
-		if stat, err := os.Stat(chunk.Path); err == nil {
-			if stat.Size() == chunk.End-chunk.Start+1 {
-				atomic.AddInt64(&progress.Downloaded, stat.Size())
-				return nil
-			}
+// retryDelay backs off exponentially from the configured delay, with jitter
+// so that chunks failing together do not all retry at the same instant.
+// A Retry-After from a 429 or 503 takes precedence, up to MaxRetryDelay:
+// a server asking for hours would otherwise park every worker that long.
+func (dm *DownloadManager) retryDelay(retry int, err error) time.Duration {
+	var status *statusError
+	if errors.As(err, &status) && status.retryAfter > 0 {
+		return min(status.retryAfter, MaxRetryDelay)
+	}
+
+	base := time.Duration(dm.config.RetryDelay) * time.Second
+	if base <= 0 {
+		return 0
+	}
+	delay := MaxRetryDelay
+	if retry < 16 && base<<retry < MaxRetryDelay {
+		delay = base << retry
+	}
+	return delay + time.Duration(rand.Int63n(int64(base/2)+1))
+}
+
+// sleepContext waits for d, returning false if ctx is cancelled first
+func sleepContext(ctx context.Context, d time.Duration) bool {
+	timer := time.NewTimer(d)
+	defer timer.Stop()
+	select {
+	case <-timer.C:
+		return true
+	case <-ctx.Done():
+		return false
+	}
+}
+
+// newStatusError describes an unexpected response, reading Retry-After
+// when the server is shedding load
+func newStatusError(resp *http.Response) error {
+	err := &statusError{code: resp.StatusCode}
+	if resp.StatusCode == http.StatusTooManyRequests || resp.StatusCode == http.StatusServiceUnavailable {
+		retryAfter := resp.Header.Get("Retry-After")
+		if seconds, convErr := strconv.Atoi(retryAfter); convErr == nil && seconds > 0 {
+			err.retryAfter = time.Duration(seconds) * time.Second
+		} else if when, parseErr := http.ParseTime(retryAfter); parseErr == nil {
+			err.retryAfter = time.Until(when)
 		}
 	}
+	return err
+}
+
+// retryable reports whether err may go away on a later attempt. Client
+// errors other than 429 and 408, unexpected success codes, and a server
+// that ignores ranges will answer the same way again.
+func retryable(err error) bool {
+	if errors.Is(err, errRangeIgnored) {
+		return false
+	}
+	var status *statusError
+	if errors.As(err, &status) {
+		return status.code >= 500 || status.code == http.StatusTooManyRequests || status.code == http.StatusRequestTimeout
+	}
+	return true
+}
+
+func (e *statusError) Error() string {
+	return fmt.Sprintf("server returned %d", e.code)
+}
+
+// nextChunk takes the next range from the queue, crediting ranges that an
+// earlier run already completed
+func (dm *DownloadManager) nextChunk(ctx context.Context, queue *chunkQueue, state *ResumeState, progress *ProgressInfo) (ChunkInfo, bool) {
+	for ctx.Err() == nil {
+		chunk, ok := queue.Take()
+		if !ok {
+			break
+		}
+		if state.IsComplete(chunk.ID) {
+			progress.Add(chunk.End - chunk.Start + 1)
+			continue
+		}
+		return chunk, true
+	}
+	return ChunkInfo{}, false
+}
 
-	req, err := http.NewRequestWithContext(ctx, "GET", urlStr, nil)
+// newRequest builds the GET for a task with its configured headers
+func (dm *DownloadManager) newRequest(ctx context.Context, task *DownloadTask) (*http.Request, error) {
+	req, err := http.NewRequestWithContext(ctx, "GET", task.URL, nil)
+	if err != nil {
+		return nil, err
+	}
+
+	req.Header.Set("User-Agent", dm.config.UserAgent)
+	for k, v := range task.Headers {
+		req.Header.Set(k, v)
+	}
+	return req, nil
+}
+
+// openRange requests one chunk and waits for the response headers
+func (dm *DownloadManager) openRange(ctx context.Context, template *http.Request, chunk ChunkInfo) *RangeResponse {
+	r := &RangeResponse{chunk: chunk}
+	r.ctx, r.stall, r.stop = dm.watchStalls(ctx)
+
+	// Time the request only once it is on the wire. Before that it may be
+	// waiting for a free HTTP/2 stream, which is queueing, not a stall;
+	// dialing and TLS have the transport's own timeouts.
+	r.stall.Disarm()
+	trace := &httptrace.ClientTrace{WroteHeaders: r.stall.Arm}
+	req := template.Clone(httptrace.WithClientTrace(r.ctx, trace))
+	req.Header.Set("Range", "bytes="+strconv.FormatInt(chunk.Start, 10)+"-"+strconv.FormatInt(chunk.End, 10))
+
+	resp, err := dm.client.Do(req)
+	if err != nil {
+		r.err = err
+		return r
+	}
+	// A prefetched body may wait for the previous range to finish; only
+	// time it once reading starts
+	r.stall.Disarm()
+
+	// A 200 would carry the whole file, which must not be written at this chunk's offset
+	if resp.StatusCode != http.StatusPartialContent {
+		resp.Body.Close()
+		if resp.StatusCode == http.StatusOK {
+			r.err = errRangeIgnored
+		} else {
+			r.err = newStatusError(resp)
+		}
+		return r
+	}
+
+	r.resp = resp
+	return r
+}
+
+// openRangeAsync issues openRange in the background
+func (dm *DownloadManager) openRangeAsync(ctx context.Context, template *http.Request, chunk ChunkInfo) <-chan *RangeResponse {
+	result := make(chan *RangeResponse, 1)
+	go func() {
+		result <- dm.openRange(ctx, template, chunk)
+	}()
+	return result
+}
+
+// Close releases the response body and its stall watch
+func (r *RangeResponse) Close() {
+	if r.resp != nil {
+		r.resp.Body.Close()
+	}
+	r.stop()
+}
+
+// downloadChunk streams an opened range straight into its place in the shared output file
+func (dm *DownloadManager) downloadChunk(r *RangeResponse, file io.WriterAt, buffer []byte, progress *ProgressInfo, nearEnd func()) error {
+	defer r.Close()
+	if r.err != nil {
+		return r.err
+	}
+
+	written, err := dm.streamToFile(r.ctx, r.stall, r.resp.Body, file, buffer, r.chunk.Start, r.chunk.End-r.chunk.Start+1, progress, nearEnd)
 	if err != nil {
+		// Roll back progress so a retry does not count the same bytes twice
+		progress.Add(-written)
 		return err
 	}
-
-	req.Header.Set("Range", fmt.Sprintf("bytes=%d-%d", chunk.Start, chunk.End))
-	req.Header.Set("User-Agent", dm.config.UserAgent)
-	for k, v := range headers {
-		req.Header.Set(k, v)
+
+	return nil
+}
+
+// directWriter sends block-aligned writes through a direct I/O handle and
+// the rest, such as the unaligned tail of the last range, through a
+// regular handle on the same file
+type directWriter struct {
+	direct   *os.File
+	buffered *os.File
+}
+
+func (w *directWriter) WriteAt(p []byte, off int64) (int, error) {
+	if off%DirectAlign == 0 && len(p)%DirectAlign == 0 {
+		return w.direct.WriteAt(p, off)
+	}
+	return w.buffered.WriteAt(p, off)
+}
+
+// writeBuffers recycles staging buffers across workers and downloads, so a
+// batch allocates them once rather than once per file
+var writeBuffers = sync.Pool{
+	New: func() any {
+		buffer := alignedBuffer(WriteBuffer)
+		return &buffer
+	},
+}
+
+// alignedBuffer returns a buffer that starts on a page boundary, as direct
+// I/O requires, so every write from it covers whole pages of memory
+func alignedBuffer(size int) []byte {
+	const pageSize = 4096
+	raw := make([]byte, size+pageSize)
+	offset := 0
+	if rem := int(uintptr(unsafe.Pointer(&raw[0])) & (pageSize - 1)); rem != 0 {
+		offset = pageSize - rem
+	}
+	return raw[offset : offset+size : offset+size]
+}
+
+// streamToFile copies a response body to file at offset. Reads are staged in
+// buffer and flushed with positional writes, so large
+// sequential writes reach the disk and parallel workers can share one file
+// descriptor without seeking. A non-negative length means the body must
+// deliver exactly that many bytes; nearEnd, if set, is called once when no
+// more than one buffer of it is left to read.
+func (dm *DownloadManager) streamToFile(ctx context.Context, stall *stallWatch, body io.Reader, file io.WriterAt, buffer []byte, offset, length int64, progress *ProgressInfo, nearEnd func()) (int64, error) {
+	var written int64
+	filled := 0
+	for {
+		// Offer the read all of the free staging space: when the socket has
+		// buffered more than one read's worth, it is drained in one syscall
+		limit := len(buffer)
+		if length >= 0 {
+			remaining := length - written
+			if int64(limit) > remaining {
+				limit = int(remaining)
+			}
+			if nearEnd != nil && remaining-int64(filled) <= int64(len(buffer)) {
+				nearEnd()
+				nearEnd = nil
+			}
+		}
+
+		var n int
+		var readErr error
+		if limit > filled {
+			stall.Arm()
+			n, readErr = body.Read(buffer[filled:limit])
+			stall.Disarm()
+		} else {
+			readErr = io.EOF
+		}
+		if n > 0 {
+			if dm.rateLimiter != nil {
+				dm.rateLimiter.Wait(ctx, n)
+			}
+			filled += n
+			// Published per read so slow transfers still move the bar;
+			// Add is one atomic add unless a redraw is due
+			progress.Add(int64(n))
+		}
+
+		if filled > 0 && (filled == len(buffer) || readErr != nil) {
+			if _, writeErr := file.WriteAt(buffer[:filled], offset+written); writeErr != nil {
+				return written, writeErr
+			}
+			written += int64(filled)
+			filled = 0
+		}
+
+		if readErr == io.EOF {
+			break
+		}
+		if readErr != nil {
+			if errors.Is(context.Cause(ctx), errReadStalled) {
+				return written, errReadStalled
+			}
+			return written, readErr
+		}
+	}
+
+	if length >= 0 && written != length {
+		return written, io.ErrUnexpectedEOF
+	}
+
+	return written, nil
+}
+
+// openResumeState loads the resume state of partPath, but only while the
+// .part file it describes is still there at full size: chunks marked done
+// in a state file whose data is gone would be skipped and leave holes in
+// the result. A stale state file is removed.
+func openResumeState(partPath string, size int64, plan chunkPlan, enabled bool) (*ResumeState, chunkPlan) {
+	statePath := partPath + ".state"
+	if enabled {
+		if info, err := os.Stat(partPath); err != nil || info.Size() != size {
+			os.Remove(statePath)
+		}
+	}
+	return loadResumeState(statePath, plan, enabled)
+}
+
+// loadResumeState restores chunk progress saved by an interrupted download.
+// The ranges a download was started with are kept for its resume, even if
+// plan, the layout a fresh start would use, has changed since (with -direct
+// toggled, or a new rate measured for the host): the saved bits only mean
+// anything for the saved boundaries. State saved for a different file size
+// is discarded.
+func loadResumeState(path string, plan chunkPlan, enabled bool) (*ResumeState, chunkPlan) {
+	fresh := func(plan chunkPlan) (*ResumeState, chunkPlan) {
+		state := &ResumeState{Size: plan.size, Unit: plan.unit, Chunks: plan.count, Done: make([]uint64, (plan.count+63)/64)}
+		if enabled {
+			state.path = path
+		}
+		return state, plan
+	}
+	if !enabled {
+		return fresh(plan)
 	}
 
-	resp, err := dm.client.Do(req)
+	data, err := os.ReadFile(path)
 	if err != nil {
-		return err
+		return fresh(plan)
 	}
-	defer resp.Body.Close()
 
-	if resp.StatusCode != http.StatusPartialContent && resp.StatusCode != http.StatusOK {
-		return fmt.Errorf("server returned %d", resp.StatusCode)
+	var saved ResumeState
+	if err := json.Unmarshal(data, &saved); err != nil || saved.Size != plan.size ||
+		saved.Unit <= 0 || saved.Chunks < 1 || int64(saved.Chunks-1)*saved.Unit >= saved.Size ||
+		len(saved.Done) != (saved.Chunks+63)/64 {
+		return fresh(plan)
 	}
 
-	file, err := os.Create(chunk.Path)
-	if err != nil {
-		return err
+	state, plan := fresh(chunkPlan{size: saved.Size, unit: saved.Unit, count: saved.Chunks})
+	state.Done = saved.Done
+	for state.frontier < plan.count && state.isComplete(state.frontier) {
+		state.frontier++
 	}
-	defer file.Close()
+	return state, plan
+}
 
-	buffer := make([]byte, BufferSize)
-	for {
-		n, err := resp.Body.Read(buffer)
-		if n > 0 {
-			if dm.rateLimiter != nil {
-				dm.rateLimiter.Wait(ctx, n)
-			}
-			if _, writeErr := file.Write(buffer[:n]); writeErr != nil {
-				return writeErr
-			}
-			atomic.AddInt64(&progress.Downloaded, int64(n))
-		}
-		if err == io.EOF {
-			break
-		}
-		if err != nil {
-			return err
-		}
-	}
+func (rs *ResumeState) IsComplete(id int) bool {
+	rs.mu.Lock()
+	defer rs.mu.Unlock()
+	return rs.isComplete(id)
+}
 
-	return nil
+func (rs *ResumeState) isComplete(id int) bool {
+	return rs.Done[id/64]&(1<<(id%64)) != 0
 }
 
-// mergeChunks combines all chunks into final file
-func (dm *DownloadManager) mergeChunks(outputPath string, chunks []ChunkInfo) error {
-	output, err := os.Create(outputPath)
-	if err != nil {
-		return err
+// MarkComplete records chunk id as written and reports whether that moved
+// the frontier, the end of the run of written chunks from the start of the
+// file
+func (rs *ResumeState) MarkComplete(id int) bool {
+	rs.mu.Lock()
+	defer rs.mu.Unlock()
+	rs.Done[id/64] |= 1 << (id % 64)
+
+	from := rs.frontier
+	for rs.frontier < rs.Chunks && rs.isComplete(rs.frontier) {
+		rs.frontier++
 	}
-	defer output.Close()
 
-	for _, chunk := range chunks {
-		input, err := os.Open(chunk.Path)
-		if err != nil {
-			return err
+	if rs.path != "" {
+		if data, err := json.Marshal(rs); err == nil {
+			os.WriteFile(rs.path, data, 0644)
 		}
-
-		if _, err := io.Copy(output, input); err != nil {
-			input.Close()
-			return err
+	}
+	return rs.frontier > from
+}
+
+// Frontier returns the number of chunks written from the start of the file
+func (rs *ResumeState) Frontier() int {
+	rs.mu.Lock()
+	defer rs.mu.Unlock()
+	return rs.frontier
+}
+
+// writeBehind flushes the file in the order it fills, one contiguous run
+// at a time rather than one range at a time. Each signal on advanced means
+// the frontier moved: writeback of the new run [from, to) starts in the
+// background, and the previous run [last, from), started on the last
+// advance and most likely on disk by now, is waited for and dropped from
+// the page cache. It runs on its own goroutine so that waiting for the disk
+// never holds up a worker and its open connection; signals that arrive
+// while it waits are merged into one run. done is closed once advanced is
+// closed and drained.
+func writeBehind(file *os.File, plan chunkPlan, state *ResumeState, from int, advanced <-chan struct{}, done chan<- struct{}) {
+	defer close(done)
+	last := from
+	for range advanced {
+		to := state.Frontier()
+		if to == from {
+			continue
 		}
-		
-		input.Close()
-		os.Remove(chunk.Path)
+		start, end := plan.Chunk(from).Start, plan.Chunk(to-1).End+1
+		startWriteback(file, start, end-start)
+		if last < from {
+			prev := plan.Chunk(last).Start
+			waitWriteback(file, prev, start-prev)
+			dropPageCache(file, prev, start-prev)
+		}
+		last, from = from, to
 	}
+}
 
-	return nil
+func (rs *ResumeState) Remove() {
+	if rs.path != "" {
+		os.Remove(rs.path)
+	}
 }
 
 // downloadSingle handles single-threaded downloads
 func (dm *DownloadManager) downloadSingle(ctx context.Context, task *DownloadTask, outputPath string, progress *ProgressInfo) error {
-	req, err := http.NewRequestWithContext(ctx, "GET", task.URL, nil)
+	ctx, stall, stop := dm.watchStalls(ctx)
+	defer stop()
+
+	req, err := dm.newRequest(ctx, task)
 	if err != nil {
 		return err
 	}
 
-	req.Header.Set("User-Agent", dm.config.UserAgent)
-	for k, v := range task.Headers {
-		req.Header.Set(k, v)
-	}
-
 	resp, err := dm.client.Do(req)
 	if err != nil {
 		return err
@@ -649,7 +1493,7 @@ func (dm *DownloadManager) downloadSingle(ctx context.Context, task *DownloadTas
 	defer resp.Body.Close()
 
 	if resp.StatusCode != http.StatusOK {
-		return fmt.Errorf("server returned %d", resp.StatusCode)
+		return newStatusError(resp)
 	}
 
 	file, err := os.Create(outputPath)
@@ -658,200 +1502,340 @@ func (dm *DownloadManager) downloadSingle(ctx context.Context, task *DownloadTas
 	}
 	defer file.Close()
 
-	buffer := make([]byte, BufferSize)
-	for {
-		n, err := resp.Body.Read(buffer)
-		if n > 0 {
-			if dm.rateLimiter != nil {
-				dm.rateLimiter.Wait(ctx, n)
-			}
-			if _, writeErr := file.Write(buffer[:n]); writeErr != nil {
-				return writeErr
-			}
-			atomic.AddInt64(&progress.Downloaded, int64(n))
-		}
-		if err == io.EOF {
-			break
-		}
-		if err != nil {
-			return err
-		}
+	// net/http does not expose the socket, so sendfile/splice cannot be used
+	// here; batching reads into large writes is the next best thing
+	staging := writeBuffers.Get().(*[]byte)
+	defer writeBuffers.Put(staging)
+	_, err = dm.streamToFile(ctx, stall, resp.Body, file, *staging, 0, resp.ContentLength, progress, nil)
+	return err
+}
+
+// Whether to draw the progress bar at all, and the pieces every render shares
+var (
+	stdoutIsTerminal = terminal.IsTerminal(int(os.Stdout.Fd()))
+
+	progressPrefix = "\r" + ColorCyan + "["
+	progressFull   = strings.Repeat("█", 40)
+	progressEmpty  = strings.Repeat("░", 40)
+)
+
+// NewProgressInfo creates progress tracking for a transfer of total bytes
+func NewProgressInfo(total int64) *ProgressInfo {
+	progress := &ProgressInfo{Total: total, started: time.Now()}
+	if total > 0 {
+		progress.invTotal = 100 / float64(total)
 	}
+	return progress
+}
 
-	return nil
+// Add records downloaded bytes. Whichever goroutine first crosses the
+// ProgressUpdate interval redraws the line, so no ticker has to poll.
+// Redirected output gets no redraws: a log would only fill with them.
+func (p *ProgressInfo) Add(n int64) {
+	p.Downloaded.Add(n)
+
+	now := int64(time.Since(p.started))
+	last := p.lastRender.Load()
+	if !stdoutIsTerminal || now-last < int64(ProgressUpdate) || !p.lastRender.CompareAndSwap(last, now) {
+		return
+	}
+	p.Render()
 }
 
-// reportProgress displays download progress
-func (dm *DownloadManager) reportProgress(ctx context.Context, task *DownloadTask, progress *ProgressInfo, done <-chan bool) {
-	ticker := time.NewTicker(ProgressUpdate)
-	defer ticker.Stop()
+// Render redraws the progress line
+func (p *ProgressInfo) Render() {
+	p.renderMu.Lock()
+	defer p.renderMu.Unlock()
 
-	lastDownloaded := int64(0)
-	lastTime := time.Now()
+	downloaded := p.Downloaded.Load()
+	now := time.Since(p.started)
+	elapsed := (now - p.renderedAt).Seconds()
+	if elapsed <= 0 {
+		return
+	}
 
-	for {
-		select {
-		case <-ctx.Done():
-			return
-		case <-done:
-			return
-		case <-ticker.C:
-			downloaded := atomic.LoadInt64(&progress.Downloaded)
-			now := time.Now()
-			elapsed := now.Sub(lastTime).Seconds()
-			
-			if elapsed > 0 {
-				speed := float64(downloaded-lastDownloaded) / elapsed / 1024 / 1024
-				percentage := float64(downloaded) / float64(progress.Total) * 100
-				
-				if speed > 0 {
-					remaining := progress.Total - downloaded
-					eta := time.Duration(float64(remaining) / (float64(downloaded-lastDownloaded) / elapsed)) * time.Second
-					progress.ETA = eta
-				}
+	speed := float64(downloaded-p.renderedSize) / elapsed / 1024 / 1024
+	percentage := float64(downloaded) * p.invTotal
 
-				active := atomic.LoadInt32(&progress.Active)
-				
-				// Progress bar
-				barWidth := 40
-				filled := int(percentage * float64(barWidth) / 100)
-				bar := strings.Repeat("█", filled) + strings.Repeat("░", barWidth-filled)
-				
-				fmt.Printf("\r%s[%s] %.1f%% %s/%s | %.2f MB/s | %d active | ETA: %s%s",
-					ColorCyan, bar, percentage,
-					formatBytes(downloaded),
-					formatBytes(progress.Total),
-					speed,
-					active,
-					formatDuration(progress.ETA),
-					ColorReset)
-				
-				lastDownloaded = downloaded
-				lastTime = now
-			}
-		}
+	if speed > 0 && p.Total > 0 {
+		remaining := p.Total - downloaded
+		eta := time.Duration(float64(remaining)/(float64(downloaded-p.renderedSize)/elapsed)) * time.Second
+		p.ETA = eta
+	}
+
+	active := p.Active.Load()
+
+	// Progress bar
+	barWidth := 40
+	filled := int(percentage * float64(barWidth) / 100)
+	if filled > barWidth {
+		filled = barWidth
 	}
+
+	// Slice the precomputed bars by byte offset instead of building new
+	// strings, and reuse the line buffer so a redraw is a single write
+	line := append(p.line[:0], progressPrefix...)
+	line = append(line, progressFull[:filled*len("█")]...)
+	line = append(line, progressEmpty[filled*len("░"):]...)
+	line = fmt.Appendf(line, "] %.1f%% %s/%s | %.2f MB/s | %d active | ETA: %s%s",
+		percentage,
+		formatBytes(downloaded),
+		formatBytes(p.Total),
+		speed,
+		active,
+		formatDuration(p.ETA),
+		ColorReset)
+	os.Stdout.Write(line)
+	p.line = line
+
+	p.renderedSize = downloaded
+	p.renderedAt = now
 }
 
-// verifyChecksums verifies file checksums
+// verifyChecksums verifies file checksums. All requested sums come from a
+// single read of the file, computed side by side.
 func (dm *DownloadManager) verifyChecksums(filepath string, task *DownloadTask) error {
-	if task.SHA256 != "" {
-		fmt.Printf("\n%sVerifying SHA256...%s", ColorYellow, ColorReset)
-		hash, err := calculateHash(filepath, "sha256")
-		if err != nil {
-			return err
-		}
-		if !strings.EqualFold(hash, task.SHA256) {
-			return fmt.Errorf("SHA256 mismatch: expected %s, got %s", task.SHA256, hash)
-		}
-		fmt.Printf(" %s✓%s\n", ColorGreen, ColorReset)
+	checks := []struct{ name, algorithm, expected string }{
+		{"SHA256", "sha256", task.SHA256},
+		{"SHA1", "sha1", task.SHA1},
+		{"MD5", "md5", task.MD5},
 	}
 
-	if task.SHA1 != "" {
-		fmt.Printf("%sVerifying SHA1...%s", ColorYellow, ColorReset)
-		hash, err := calculateHash(filepath, "sha1")
-		if err != nil {
-			return err
-		}
-		if !strings.EqualFold(hash, task.SHA1) {
-			return fmt.Errorf("SHA1 mismatch: expected %s, got %s", task.SHA1, hash)
+	var algorithms []string
+	for _, check := range checks {
+		if check.expected != "" {
+			algorithms = append(algorithms, check.algorithm)
 		}
-		fmt.Printf(" %s✓%s\n", ColorGreen, ColorReset)
+	}
+	if len(algorithms) == 0 {
+		return nil
 	}
 
-	if task.MD5 != "" {
-		fmt.Printf("%sVerifying MD5...%s", ColorYellow, ColorReset)
-		hash, err := calculateHash(filepath, "md5")
-		if err != nil {
-			return err
-		}
-		if !strings.EqualFold(hash, task.MD5) {
-			return fmt.Errorf("MD5 mismatch: expected %s, got %s", task.MD5, hash)
+	fmt.Printf("\n%sVerifying %s...%s", ColorYellow, strings.ToUpper(strings.Join(algorithms, ", ")), ColorReset)
+	sums, err := calculateHashes(filepath, algorithms)
+	if err != nil {
+		return err
+	}
+	for _, check := range checks {
+		if check.expected != "" && !strings.EqualFold(sums[check.algorithm], check.expected) {
+			fmt.Printf(" %s✗%s\n", ColorRed, ColorReset)
+			return fmt.Errorf("%s mismatch: expected %s, got %s", check.name, check.expected, sums[check.algorithm])
 		}
-		fmt.Printf(" %s✓%s\n", ColorGreen, ColorReset)
 	}
+	fmt.Printf(" %s✓%s\n", ColorGreen, ColorReset)
 
 	return nil
 }
 
 // calculateHash calculates file hash
 func calculateHash(filepath string, algorithm string) (string, error) {
-	file, err := os.Open(filepath)
+	sums, err := calculateHashes(filepath, []string{algorithm})
 	if err != nil {
 		return "", err
 	}
+	return sums[algorithm], nil
+}
+
+// calculateHashes computes several hashes of a file in one read. With more
+// than one, each hash runs in its own goroutine fed through a pipe, so they
+// use separate cores while the file is read once.
+func calculateHashes(filepath string, algorithms []string) (map[string]string, error) {
+	hashes := make([]hash.Hash, len(algorithms))
+	for i, algorithm := range algorithms {
+		switch algorithm {
+		case "sha256":
+			hashes[i] = sha256.New()
+		case "sha1":
+			hashes[i] = sha1.New()
+		case "md5":
+			hashes[i] = md5.New()
+		default:
+			return nil, fmt.Errorf("unsupported hash algorithm: %s", algorithm)
+		}
+	}
+
+	file, err := os.Open(filepath)
+	if err != nil {
+		return nil, err
+	}
 	defer file.Close()
 
-	var h hash.Hash
-	switch algorithm {
-	case "sha256":
-		h = sha256.New()
-	case "sha1":
-		h = sha1.New()
-	case "md5":
-		h = md5.New()
-	default:
-		return "", fmt.Errorf("unsupported hash algorithm: %s", algorithm)
+	if len(hashes) == 1 {
+		if _, err := io.Copy(hashes[0], file); err != nil {
+			return nil, err
+		}
+	} else {
+		writers := make([]io.Writer, len(hashes))
+		pipes := make([]*io.PipeWriter, len(hashes))
+		var wg sync.WaitGroup
+		for i, h := range hashes {
+			reader, writer := io.Pipe()
+			writers[i], pipes[i] = writer, writer
+			wg.Add(1)
+			go func(h hash.Hash) {
+				defer wg.Done()
+				_, err := io.Copy(h, reader)
+				reader.CloseWithError(err)
+			}(h)
+		}
+
+		_, err := io.Copy(io.MultiWriter(writers...), file)
+		for _, pipe := range pipes {
+			pipe.CloseWithError(err)
+		}
+		wg.Wait()
+		if err != nil {
+			return nil, err
+		}
 	}
 
-	if _, err := io.Copy(h, file); err != nil {
-		return "", err
+	sums := make(map[string]string, len(algorithms))
+	for i, algorithm := range algorithms {
+		sums[algorithm] = hex.EncodeToString(hashes[i].Sum(nil))
+	}
+	return sums, nil
+}
+
+// validateURL checks that raw is an absolute http(s) or file URL
+func validateURL(raw string) error {
+	u, err := url.Parse(raw)
+	if err != nil {
+		return err
+	}
+	switch u.Scheme {
+	case "http", "https":
+		if u.Host == "" {
+			return errors.New("missing host")
+		}
+	case "file":
+		if u.Path == "" {
+			return errors.New("missing path")
+		}
+	default:
+		return fmt.Errorf("unsupported scheme %q", u.Scheme)
 	}
+	return nil
+}
 
-	return hex.EncodeToString(h.Sum(nil)), nil
+// validateRemoteURL is validateURL limited to http(s), for URLs that come
+// from the network rather than the local user
+func validateRemoteURL(raw string) error {
+	if err := validateURL(raw); err != nil {
+		return err
+	}
+	if u, _ := url.Parse(raw); u.Scheme == "file" {
+		return errors.New("file URLs are not accepted here")
+	}
+	return nil
 }
 
 // BatchDownload handles multiple downloads
 func (dm *DownloadManager) BatchDownload(ctx context.Context, urlFile string, concurrent int) error {
-	file, err := os.Open(urlFile)
+	// Read the list in one go and scan it as bytes; only the fields that
+	// are kept get converted to strings
+	data, err := os.ReadFile(urlFile)
 	if err != nil {
 		return err
 	}
-	defer file.Close()
 
 	var tasks []DownloadTask
-	scanner := bufio.NewScanner(file)
-	for scanner.Scan() {
-		line := strings.TrimSpace(scanner.Text())
-		if line == "" || strings.HasPrefix(line, "#") {
+	seen := make(map[string]bool)
+	names := make(map[string]bool)
+	duplicates := 0
+	for lineNo := 1; len(data) > 0; lineNo++ {
+		var line []byte
+		line, data, _ = bytes.Cut(data, []byte{'\n'})
+		line = bytes.TrimSpace(line)
+		if len(line) == 0 || line[0] == '#' {
+			continue
+		}
+
+		parts := bytes.Fields(line)
+		// The same URL would download to the same file twice
+		if seen[string(parts[0])] {
+			duplicates++
+			continue
+		}
+		rawURL := string(parts[0])
+		if err := validateURL(rawURL); err != nil {
+			fmt.Printf("%sSkipping line %d: invalid URL %s: %v%s\n", ColorYellow, lineNo, rawURL, err, ColorReset)
 			continue
 		}
+		seen[rawURL] = true
+
+		// Name every file up front: different URLs can end in the same
+		// name, and each download needs its own .part and .state
+		parsedURL, _ := url.Parse(rawURL)
+		name := path.Base(parsedURL.Path)
+		if name == "/" || name == "." {
+			name = fmt.Sprintf("download_%d", lineNo)
+		}
 
-		parts := strings.Fields(line)
 		task := DownloadTask{
-			URL:    parts[0],
-			Chunks: dm.maxWorkers,
+			URL:      rawURL,
+			Filepath: uniqueName(name, names),
+			Chunks:   dm.maxWorkers,
 		}
 
-		for i := 1; i < len(parts); i++ {
-			if strings.HasPrefix(parts[i], "sha256:") {
-				task.SHA256 = strings.TrimPrefix(parts[i], "sha256:")
-			} else if strings.HasPrefix(parts[i], "sha1:") {
-				task.SHA1 = strings.TrimPrefix(parts[i], "sha1:")
-			} else if strings.HasPrefix(parts[i], "md5:") {
-				task.MD5 = strings.TrimPrefix(parts[i], "md5:")
+		for _, part := range parts[1:] {
+			if sum, ok := bytes.CutPrefix(part, []byte("sha256:")); ok {
+				task.SHA256 = string(sum)
+			} else if sum, ok := bytes.CutPrefix(part, []byte("sha1:")); ok {
+				task.SHA1 = string(sum)
+			} else if sum, ok := bytes.CutPrefix(part, []byte("md5:")); ok {
+				task.MD5 = string(sum)
 			}
 		}
 
 		tasks = append(tasks, task)
 	}
 
-	fmt.Printf("%sFound %d URLs to download%s\n\n", ColorCyan, len(tasks), ColorReset)
+	fmt.Printf("%sFound %d URLs to download%s\n", ColorCyan, len(tasks), ColorReset)
+	if duplicates > 0 {
+		fmt.Printf("%sSkipped %d duplicate URLs%s\n", ColorYellow, duplicates, ColorReset)
+	}
+	fmt.Println()
+
+	if concurrent < 1 {
+		concurrent = 1
+	}
+
+	// Probe URLs a bounded window ahead of the scheduler, so downloads find
+	// their metadata ready without waiting for the whole list to be probed
+	probeCtx, stopProbes := context.WithCancel(ctx)
+	scheduled := make(chan struct{}, len(tasks))
+	probed := make(chan struct{})
+	go func() {
+		defer close(probed)
+		dm.preflight(probeCtx, tasks, concurrent, scheduled)
+	}()
 
 	sem := make(chan struct{}, concurrent)
 	var wg sync.WaitGroup
+	var failed atomic.Int64
+	started := 0
 	
+schedule:
 	for i, task := range tasks {
+		// Take a slot before spawning, so only `concurrent` goroutines exist
+		// at a time and each one starts downloading as soon as it is created.
+		// Once the batch is cancelled nothing new is started.
+		select {
+		case sem <- struct{}{}:
+		case <-ctx.Done():
+			break schedule
+		}
+		started++
+		scheduled <- struct{}{}
 		wg.Add(1)
 		go func(index int, t DownloadTask) {
 			defer wg.Done()
-			
-			sem <- struct{}{}
 			defer func() { <-sem }()
 			
 			fmt.Printf("%s[%d/%d] Downloading %s%s\n", ColorBlue, index+1, len(tasks), t.URL, ColorReset)
 			
 			if err := dm.Download(ctx, &t); err != nil {
+				failed.Add(1)
 				fmt.Printf("%s[%d/%d] Failed: %v%s\n", ColorRed, index+1, len(tasks), err, ColorReset)
 			} else {
 				fmt.Printf("%s[%d/%d] Completed%s\n", ColorGreen, index+1, len(tasks), ColorReset)
@@ -860,9 +1844,84 @@ func (dm *DownloadManager) BatchDownload(ctx context.Context, urlFile string, co
 	}
 
 	wg.Wait()
+
+	// Probes left unused, for downloads never started or probed too late,
+	// must not outlive the batch
+	stopProbes()
+	<-probed
+	for _, task := range tasks {
+		dm.probes.Delete(task.URL)
+	}
+
+	failures := int(failed.Load())
+	fmt.Printf("\n%sBatch finished: %d completed, %d failed", ColorCyan, started-failures, failures)
+	if skipped := len(tasks) - started; skipped > 0 {
+		fmt.Printf(", %d not started", skipped)
+	}
+	fmt.Printf("%s\n", ColorReset)
+	if err := ctx.Err(); err != nil {
+		return err
+	}
+	if failures > 0 {
+		return fmt.Errorf("%d of %d downloads failed", failures, len(tasks))
+	}
 	return nil
 }
 
+// uniqueName returns name, or name with a counter before its extension
+// when an earlier file of the batch already took it
+func uniqueName(name string, taken map[string]bool) string {
+	unique := name
+	ext := path.Ext(name)
+	for i := 1; taken[unique]; i++ {
+		unique = fmt.Sprintf("%s_%d%s", strings.TrimSuffix(name, ext), i, ext)
+	}
+	taken[unique] = true
+	return unique
+}
+
+// preflight probes the URLs of a batch ahead of their downloads, many at a
+// time, so each download finds its size and range support already cached
+// instead of paying a metadata round trip before it can plan its ranges.
+// It stays at most concurrent+maxProbes URLs ahead of the downloads
+// started, one of which is signalled on scheduled each time. Failures are
+// left for the download itself to retry and report.
+func (dm *DownloadManager) preflight(ctx context.Context, tasks []DownloadTask, concurrent int, scheduled <-chan struct{}) {
+	const maxProbes = 16
+
+	sem := make(chan struct{}, maxProbes)
+	var wg sync.WaitGroup
+	for i, task := range tasks {
+		if i >= concurrent+maxProbes {
+			select {
+			case <-scheduled:
+			case <-ctx.Done():
+				wg.Wait()
+				return
+			}
+		}
+		// Local files are stat'ed by the download itself
+		if u, err := url.Parse(task.URL); err != nil || u.Scheme == "file" {
+			continue
+		}
+		select {
+		case sem <- struct{}{}:
+		case <-ctx.Done():
+			wg.Wait()
+			return
+		}
+		wg.Add(1)
+		go func(urlStr string) {
+			defer wg.Done()
+			defer func() { <-sem }()
+			if probe, err := dm.probeURL(ctx, urlStr); err == nil {
+				dm.probes.Store(urlStr, probe)
+			}
+		}(task.URL)
+	}
+	wg.Wait()
+}
+
 // NewJobQueue creates a new job queue
 func NewJobQueue(maxActive int, dbPath string) (*JobQueue, error) {
 	// Create directory if it doesn't exist
@@ -914,6 +1973,7 @@ func NewJobQueue(maxActive int, dbPath string) (*JobQueue, error) {
 		maxActive: maxActive,
 		db:        db,
 		stopCh:    make(chan struct{}),
+		wakeCh:    make(chan struct{}, 1),
 	}
 
 	if err := jq.loadJobs(); err != nil {
@@ -981,6 +2041,7 @@ func (jq *JobQueue) AddJob(job *Job) error {
 	jq.jobs[job.ID] = job
 	jq.queue = append(jq.queue, job)
 	jq.sortQueue()
+	jq.wake()
 
 	return nil
 }
@@ -991,9 +2052,10 @@ func (jq *JobQueue) sortQueue() {
 	})
 }
 
+// ProcessQueue schedules jobs as soon as they are queued or a slot frees
+// up, rather than polling the queue on a timer
 func (jq *JobQueue) ProcessQueue(ctx context.Context) {
-	ticker := time.NewTicker(time.Second)
-	defer ticker.Stop()
+	jq.processNext()
 
 	for {
 		select {
@@ -1001,25 +2063,33 @@ func (jq *JobQueue) ProcessQueue(ctx context.Context) {
 			return
 		case <-jq.stopCh:
 			return
-		case <-ticker.C:
+		case <-jq.wakeCh:
 			jq.processNext()
 		}
 	}
 }
 
+// wake asks ProcessQueue for a scheduling pass; signals that arrive while
+// one is already pending are merged into it
+func (jq *JobQueue) wake() {
+	select {
+	case jq.wakeCh <- struct{}{}:
+	default:
+	}
+}
+
+// processNext starts queued jobs until every active slot is taken
 func (jq *JobQueue) processNext() {
 	jq.mu.Lock()
 	defer jq.mu.Unlock()
 
-	if len(jq.active) >= jq.maxActive || len(jq.queue) == 0 {
-		return
-	}
-
-	job := jq.queue[0]
-	jq.queue = jq.queue[1:]
-	jq.active[job.ID] = job
+	for len(jq.active) < jq.maxActive && len(jq.queue) > 0 {
+		job := jq.queue[0]
+		jq.queue = jq.queue[1:]
+		jq.active[job.ID] = job
 
-	go jq.processJob(job)
+		go jq.processJob(job)
+	}
 }
 
 func (jq *JobQueue) processJob(job *Job) {
@@ -1027,6 +2097,7 @@ func (jq *JobQueue) processJob(job *Job) {
 		jq.mu.Lock()
 		delete(jq.active, job.ID)
 		jq.mu.Unlock()
+		jq.wake()
 	}()
 
 	job.Status = "downloading"
@@ -1044,7 +2115,12 @@ func (jq *JobQueue) processJob(job *Job) {
 	}
 
 	if jq.manager != nil {
-		if err := jq.manager.Download(ctx, task); err != nil {
+		// Jobs stored before file:// was refused by the API are refused here
+		err := validateRemoteURL(job.URL)
+		if err == nil {
+			err = jq.manager.Download(ctx, task)
+		}
+		if err != nil {
 			job.Status = "failed"
 			job.Error = err.Error()
 			jq.mu.Lock()
@@ -1141,6 +2217,12 @@ func (d *DaemonServer) handleAddJob(w http.ResponseWriter, r *http.Request) {
 		return
 	}
 
+	// The API is unauthenticated, so file:// sources stay CLI-only
+	if err := validateRemoteURL(job.URL); err != nil {
+		http.Error(w, "invalid URL: "+err.Error(), http.StatusBadRequest)
+		return
+	}
+
 	if err := d.queue.AddJob(&job); err != nil {
 		http.Error(w, err.Error(), http.StatusInternalServerError)
 		return
@@ -1184,6 +2266,7 @@ func (d *DaemonServer) handleResumeJob(w http.ResponseWriter, r *http.Request) {
 		d.queue.queue = append(d.queue.queue, job)
 		d.queue.sortQueue()
 		d.queue.updateJobInDB(job)
+		d.queue.wake()
 		w.Write([]byte(`{"status":"resumed"}`))
 	} else {
 		http.Error(w, "Job not found", http.StatusNotFound)
@@ -1226,6 +2309,7 @@ func (d *DaemonServer) handleRetryJob(w http.ResponseWriter, r *http.Request) {
 		d.queue.queue = append(d.queue.queue, job)
 		d.queue.sortQueue()
 		d.queue.updateJobInDB(job)
+		d.queue.wake()
 		w.Write([]byte(`{"status":"retrying"}`))
 	} else {
 		http.Error(w, "Job not found in failed queue", http.StatusNotFound)
@@ -1484,6 +2568,20 @@ func loadConfig(path string) (*Config, error) {
 	return config, nil
 }
 
+// getConfig loads the default configuration file on first use and reuses it
+// afterwards, so commands that never look at it do not pay for the read
+func getConfig() (*Config, error) {
+	if globalConfig != nil {
+		return globalConfig, nil
+	}
+	config, err := loadConfig("")
+	if err != nil {
+		return nil, err
+	}
+	globalConfig = config
+	return config, nil
+}
+
 func saveConfig(config *Config) error {
 	configDir := filepath.Dir(config.ConfigPath)
 	if err := os.MkdirAll(configDir, 0755); err != nil {
@@ -1535,6 +2633,26 @@ func formatDuration(d time.Duration) string {
 }
 
 // CLI Commands
+// signalContext returns a context that is cancelled, after printing msg,
+// when the process receives SIGINT or SIGTERM
+func signalContext(msg string) (context.Context, context.CancelFunc) {
+	ctx, cancel := context.WithCancel(context.Background())
+
+	sigChan := make(chan os.Signal, 1)
+	signal.Notify(sigChan, os.Interrupt, syscall.SIGTERM)
+	go func() {
+		select {
+		case <-sigChan:
+			fmt.Printf("\n\n%s\n", msg)
+			cancel()
+		case <-ctx.Done():
+		}
+		signal.Stop(sigChan)
+	}()
+
+	return ctx, cancel
+}
+
 func cmdDownload(args []string) {
 	fs := flag.NewFlagSet("download", flag.ExitOnError)
 	connections := fs.Int("c", DefaultChunks, "number of connections")
@@ -1546,6 +2664,7 @@ func cmdDownload(args []string) {
 	rateLimit := fs.Int64("rate", 0, "rate limit in bytes/sec")
 	proxy := fs.String("proxy", "", "proxy URL")
 	header := fs.String("H", "", "custom header (format: Key:Value)")
+	direct := fs.Bool("direct", false, "write with direct I/O, bypassing the page cache")
 	
 	if err := fs.Parse(args); err != nil {
 		log.Fatal(err)
@@ -1562,6 +2681,7 @@ func cmdDownload(args []string) {
 	config.DownloadDir = *downloadDir
 	config.RateLimit = *rateLimit
 	config.ProxyURL = *proxy
+	config.DirectIO = *direct
 	
 	if *header != "" {
 		parts := strings.SplitN(*header, ":", 2)
@@ -1575,16 +2695,8 @@ func cmdDownload(args []string) {
 		log.Fatal(err)
 	}
 
-	ctx, cancel := context.WithCancel(context.Background())
+	ctx, cancel := signalContext("Download interrupted")
 	defer cancel()
-	
-	sigChan := make(chan os.Signal, 1)
-	signal.Notify(sigChan, os.Interrupt, syscall.SIGTERM)
-	go func() {
-		<-sigChan
-		fmt.Println("\n\nDownload interrupted")
-		cancel()
-	}()
 
 	task := &DownloadTask{
 		URL:      fs.Arg(0),
@@ -1624,6 +2736,7 @@ func cmdBatch(args []string) {
 
 	config := DefaultConfig()
 	config.MaxConnections = *connections
+	config.MaxParallel = *concurrent
 	config.DownloadDir = *downloadDir
 
 	dm, err := NewDownloadManager(config)
@@ -1631,16 +2744,8 @@ func cmdBatch(args []string) {
 		log.Fatal(err)
 	}
 
-	ctx, cancel := context.WithCancel(context.Background())
+	ctx, cancel := signalContext("Batch download interrupted")
 	defer cancel()
-	
-	sigChan := make(chan os.Signal, 1)
-	signal.Notify(sigChan, os.Interrupt, syscall.SIGTERM)
-	go func() {
-		<-sigChan
-		fmt.Println("\n\nBatch download interrupted")
-		cancel()
-	}()
 
 	if err := dm.BatchDownload(ctx, fs.Arg(0), *concurrent); err != nil {
 		log.Fatal(err)
@@ -1657,7 +2762,13 @@ func cmdDaemon(args []string) {
 		log.Fatal(err)
 	}
 
-	config, err := loadConfig(*configPath)
+	var config *Config
+	var err error
+	if *configPath == "" {
+		config, err = getConfig()
+	} else {
+		config, err = loadConfig(*configPath)
+	}
 	if err != nil {
 		log.Fatal(err)
 	}
@@ -1759,13 +2870,14 @@ func cmdConfig(args []string) {
 		log.Fatal(err)
 	}
 
-	config, err := loadConfig("")
+	config, err := getConfig()
 	if err != nil {
 		log.Fatal(err)
 	}
 
 	if *reset {
 		config = DefaultConfig()
+		globalConfig = config
 		if err := saveConfig(config); err != nil {
 			log.Fatal(err)
 		}
@@ -1802,6 +2914,10 @@ func cmdConfig(args []string) {
 			config.DaemonPort, _ = strconv.Atoi(value)
 		case "enable_http2":
 			config.EnableHTTP2 = value == "true"
+		case "direct_io":
+			config.DirectIO = value == "true"
+		case "socket_buffer":
+			config.SocketBuffer, _ = strconv.Atoi(value)
 		case "enable_daemon":
 			config.EnableDaemon = value == "true"
 		case "max_parallel":
@@ -1863,22 +2979,28 @@ func cmdConfig(args []string) {
 
 func cmdTUI(args []string) {
 	// Simple TUI mode using terminal controls
-	fmt.Printf("\033[2J\033[H") // Clear screen
-	
-	config, _ := loadConfig("")
-	dm, err := NewDownloadManager(config)
+	config, err := getConfig()
 	if err != nil {
 		log.Fatal(err)
 	}
 
+	// The download manager is only built once a download is started, so
+	// browsing the menu, settings or statistics never sets up the client.
+	// Settings changed from the menu before then are picked up too.
+	var dm *DownloadManager
+	downloader := func() *DownloadManager {
+		if dm == nil {
+			if dm, err = NewDownloadManager(config); err != nil {
+				log.Fatal(err)
+			}
+		}
+		return dm
+	}
+
 	reader := bufio.NewReader(os.Stdin)
 	
 	for {
-		fmt.Printf("\033[2J\033[H") // Clear screen
-		printTUIHeader()
-		printTUIMenu()
-		
-		fmt.Print("\nSelect option: ")
+		os.Stdout.WriteString(tuiScreen)
 		choice, _ := reader.ReadString('\n')
 		choice = strings.TrimSpace(choice)
 		
@@ -1888,7 +3010,11 @@ func cmdTUI(args []string) {
 			url, _ := reader.ReadString('\n')
 			url = strings.TrimSpace(url)
 			
-			if url != "" {
+			if err := validateURL(url); url != "" && err != nil {
+				fmt.Printf("%sInvalid URL: %v%s\n", ColorRed, err, ColorReset)
+				fmt.Print("\nPress Enter to continue...")
+				reader.ReadString('\n')
+			} else if url != "" {
 				ctx := context.Background()
 				task := &DownloadTask{
 					URL:    url,
@@ -1896,7 +3022,7 @@ func cmdTUI(args []string) {
 				}
 				
 				fmt.Println("\nStarting download...")
-				if err := dm.Download(ctx, task); err != nil {
+				if err := downloader().Download(ctx, task); err != nil {
 					fmt.Printf("%sError: %v%s\n", ColorRed, err, ColorReset)
 				}
 				fmt.Print("\nPress Enter to continue...")
@@ -1910,7 +3036,7 @@ func cmdTUI(args []string) {
 			
 			if filepath != "" {
 				ctx := context.Background()
-				if err := dm.BatchDownload(ctx, filepath, config.MaxParallel); err != nil {
+				if err := downloader().BatchDownload(ctx, filepath, config.MaxParallel); err != nil {
 					fmt.Printf("%sError: %v%s\n", ColorRed, err, ColorReset)
 				}
 				fmt.Print("\nPress Enter to continue...")
@@ -1941,27 +3067,26 @@ func cmdTUI(args []string) {
 	}
 }
 
-func printTUIHeader() {
-	fmt.Printf("%s╔══════════════════════════════════════════════════════╗%s\n", ColorGreen, ColorReset)
-	fmt.Printf("%s║                                                      ║%s\n", ColorGreen, ColorReset)
-	fmt.Printf("%s║              FastDL v%s - TUI Mode               ║%s\n", ColorGreen, Version, ColorReset)
-	fmt.Printf("%s║           High-Performance Download Manager          ║%s\n", ColorGreen, ColorReset)
-	fmt.Printf("%s║                                                      ║%s\n", ColorGreen, ColorReset)
-	fmt.Printf("%s╚══════════════════════════════════════════════════════╝%s\n\n", ColorGreen, ColorReset)
-}
-
-func printTUIMenu() {
-	fmt.Printf("%s┌─────────────────────────────────────┐%s\n", ColorCyan, ColorReset)
-	fmt.Printf("%s│           MAIN MENU                 │%s\n", ColorCyan, ColorReset)
-	fmt.Printf("%s├─────────────────────────────────────┤%s\n", ColorCyan, ColorReset)
-	fmt.Printf("%s│  1. %sSingle Download                %s│%s\n", ColorCyan, ColorWhite, ColorCyan, ColorReset)
-	fmt.Printf("%s│  2. %sBatch Download                 %s│%s\n", ColorCyan, ColorWhite, ColorCyan, ColorReset)
-	fmt.Printf("%s│  3. %sConfiguration                  %s│%s\n", ColorCyan, ColorWhite, ColorCyan, ColorReset)
-	fmt.Printf("%s│  4. %sStart Daemon                   %s│%s\n", ColorCyan, ColorWhite, ColorCyan, ColorReset)
-	fmt.Printf("%s│  5. %sStatistics                     %s│%s\n", ColorCyan, ColorWhite, ColorCyan, ColorReset)
-	fmt.Printf("%s│  Q. %sQuit                           %s│%s\n", ColorCyan, ColorYellow, ColorCyan, ColorReset)
-	fmt.Printf("%s└─────────────────────────────────────┘%s\n", ColorCyan, ColorReset)
-}
+// tuiScreen is the static main screen: clear, header, menu and prompt,
+// drawn with a single write per redraw
+const tuiScreen = "\033[2J\033[H" +
+	ColorGreen + "╔══════════════════════════════════════════════════════╗" + ColorReset + "\n" +
+	ColorGreen + "║                                                      ║" + ColorReset + "\n" +
+	ColorGreen + "║              FastDL v" + Version + " - TUI Mode               ║" + ColorReset + "\n" +
+	ColorGreen + "║           High-Performance Download Manager          ║" + ColorReset + "\n" +
+	ColorGreen + "║                                                      ║" + ColorReset + "\n" +
+	ColorGreen + "╚══════════════════════════════════════════════════════╝" + ColorReset + "\n\n" +
+	ColorCyan + "┌─────────────────────────────────────┐" + ColorReset + "\n" +
+	ColorCyan + "│           MAIN MENU                 │" + ColorReset + "\n" +
+	ColorCyan + "├─────────────────────────────────────┤" + ColorReset + "\n" +
+	ColorCyan + "│  1. " + ColorWhite + "Single Download                " + ColorCyan + "│" + ColorReset + "\n" +
+	ColorCyan + "│  2. " + ColorWhite + "Batch Download                 " + ColorCyan + "│" + ColorReset + "\n" +
+	ColorCyan + "│  3. " + ColorWhite + "Configuration                  " + ColorCyan + "│" + ColorReset + "\n" +
+	ColorCyan + "│  4. " + ColorWhite + "Start Daemon                   " + ColorCyan + "│" + ColorReset + "\n" +
+	ColorCyan + "│  5. " + ColorWhite + "Statistics                     " + ColorCyan + "│" + ColorReset + "\n" +
+	ColorCyan + "│  Q. " + ColorYellow + "Quit                           " + ColorCyan + "│" + ColorReset + "\n" +
+	ColorCyan + "└─────────────────────────────────────┘" + ColorReset + "\n" +
+	"\nSelect option: "
 
 func printStats(config *Config) {
 	fmt.Printf("\n%s=== Statistics ===%s\n", ColorCyan, ColorReset)
@@ -2052,13 +3177,6 @@ func printUsage() {
 }
 
 func main() {
-	// Initialize global configuration
-	var err error
-	globalConfig, err = loadConfig("")
-	if err != nil {
-		log.Fatal(err)
-	}
-
 	if len(os.Args) < 2 {
 		// If no arguments, start TUI mode
 		cmdTUI([]string{})
@@ -0,0 +1,45 @@
+//go:build linux
+
+package main
+
+import (
+	"os"
+
+	"golang.org/x/sys/unix"
+)
+
+// preallocate sizes the file and reserves its blocks up front, so parallel
+// chunk writes do not fragment it. Filesystems without fallocate support
+// (tmpfs on old kernels, NFS, CIFS) keep the sparse file from the truncate
+// rather than having zeros written out.
+func preallocate(file *os.File, size int64) error {
+	if err := file.Truncate(size); err != nil {
+		return err
+	}
+	if size > 0 {
+		unix.Fallocate(int(file.Fd()), 0, 0, size)
+	}
+	return nil
+}
+
+// dropPageCache advises the kernel that a written range will not be read again
+func dropPageCache(file *os.File, offset, length int64) {
+	unix.Fadvise(int(file.Fd()), offset, length, unix.FADV_DONTNEED)
+}
+
+// openDirect opens path for O_DIRECT writes, which skip the page cache
+// entirely; offsets, lengths and buffers must be block aligned
+func openDirect(path string) (*os.File, error) {
+	return os.OpenFile(path, os.O_WRONLY|unix.O_DIRECT, 0)
+}
+
+// startWriteback queues a written range for writeback without waiting
+func startWriteback(file *os.File, offset, length int64) {
+	unix.SyncFileRange(int(file.Fd()), offset, length, unix.SYNC_FILE_RANGE_WRITE)
+}
+
+// waitWriteback blocks until a range's writeback has completed
+func waitWriteback(file *os.File, offset, length int64) {
+	unix.SyncFileRange(int(file.Fd()), offset, length,
+		unix.SYNC_FILE_RANGE_WAIT_BEFORE|unix.SYNC_FILE_RANGE_WRITE|unix.SYNC_FILE_RANGE_WAIT_AFTER)
+}
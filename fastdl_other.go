@@ -0,0 +1,28 @@
+//go:build !linux && !darwin
+
+package main
+
+import (
+	"errors"
+	"os"
+)
+
+// preallocate sizes the file. On Windows this is SetEndOfFile; skipping
+// zero-fill with SetFileValidData would need SeManageVolumePrivilege.
+func preallocate(file *os.File, size int64) error {
+	return file.Truncate(size)
+}
+
+// dropPageCache is a no-op where posix_fadvise is unavailable
+func dropPageCache(file *os.File, offset, length int64) {}
+
+// openDirect reports that direct I/O is not implemented on this platform
+func openDirect(path string) (*os.File, error) {
+	return nil, errors.New("direct I/O is not supported on this platform")
+}
+
+// startWriteback is a no-op where sync_file_range is unavailable
+func startWriteback(file *os.File, offset, length int64) {}
+
+// waitWriteback is a no-op where sync_file_range is unavailable
+func waitWriteback(file *os.File, offset, length int64) {}
@@ -0,0 +1,291 @@
+package main
+
+import (
+	"errors"
+	"net/http"
+	"os"
+	"path/filepath"
+	"testing"
+	"time"
+)
+
+func TestMarkCompleteAdvancesFrontier(t *testing.T) {
+	state, _ := loadResumeState("", chunkPlan{size: 10000, unit: 3000, count: 4}, false)
+
+	steps := []struct {
+		id       int
+		advanced bool
+		frontier int
+	}{
+		{1, false, 0}, // chunk 0 still missing
+		{0, true, 2},  // chunks 0 and 1 are written
+		{3, false, 2}, // chunk 2 still missing
+		{2, true, 4},  // the whole file is written
+	}
+	for _, step := range steps {
+		if advanced := state.MarkComplete(step.id); advanced != step.advanced {
+			t.Fatalf("MarkComplete(%d) = %v, want %v", step.id, advanced, step.advanced)
+		}
+		if frontier := state.Frontier(); frontier != step.frontier {
+			t.Fatalf("after MarkComplete(%d), Frontier() = %d, want %d", step.id, frontier, step.frontier)
+		}
+	}
+}
+
+func TestLoadResumeStateKeepsSavedLayout(t *testing.T) {
+	path := filepath.Join(t.TempDir(), "file.part.state")
+	saved := chunkPlan{size: 10000, unit: 3000, count: 4}
+
+	state, _ := loadResumeState(path, saved, true)
+	state.MarkComplete(0)
+	state.MarkComplete(2)
+
+	// A fresh start would now use a different unit, as it does when
+	// -direct is toggled or the measured rate changes
+	state, plan := loadResumeState(path, chunkPlan{size: 10000, unit: 4096, count: 3}, true)
+	if plan != saved {
+		t.Fatalf("plan = %+v, want the saved %+v", plan, saved)
+	}
+	for id, want := range []bool{true, false, true, false} {
+		if got := state.IsComplete(id); got != want {
+			t.Errorf("IsComplete(%d) = %v, want %v", id, got, want)
+		}
+	}
+
+	// The frontier resumes after chunk 0, and completing chunk 1 joins it
+	// to chunk 2
+	if frontier := state.Frontier(); frontier != 1 {
+		t.Errorf("Frontier() = %d, want 1", frontier)
+	}
+	if !state.MarkComplete(1) || state.Frontier() != 3 {
+		t.Errorf("after MarkComplete(1), Frontier() = %d, want 3", state.Frontier())
+	}
+}
+
+func TestLoadResumeStateDiscardsMismatch(t *testing.T) {
+	dir := t.TempDir()
+	plan := chunkPlan{size: 10000, unit: 3000, count: 4}
+
+	// Saved for a file of another size
+	resized := filepath.Join(dir, "resized.state")
+	state, _ := loadResumeState(resized, chunkPlan{size: 20000, unit: 3000, count: 7}, true)
+	state.MarkComplete(0)
+
+	// Unreadable
+	corrupt := filepath.Join(dir, "corrupt.state")
+	if err := os.WriteFile(corrupt, []byte("{"), 0644); err != nil {
+		t.Fatal(err)
+	}
+
+	// Inconsistent: five chunks of 3000 bytes overshoot 10000
+	inconsistent := filepath.Join(dir, "inconsistent.state")
+	if err := os.WriteFile(inconsistent, []byte(`{"size":10000,"unit":3000,"chunks":5,"done":[1]}`), 0644); err != nil {
+		t.Fatal(err)
+	}
+
+	for _, path := range []string{resized, corrupt, inconsistent} {
+		state, got := loadResumeState(path, plan, true)
+		if got != plan {
+			t.Errorf("%s: plan = %+v, want %+v", filepath.Base(path), got, plan)
+		}
+		for id := 0; id < plan.count; id++ {
+			if state.IsComplete(id) {
+				t.Errorf("%s: chunk %d restored from discarded state", filepath.Base(path), id)
+			}
+		}
+	}
+}
+
+func TestLoadResumeStateDisabled(t *testing.T) {
+	path := filepath.Join(t.TempDir(), "file.part.state")
+
+	state, _ := loadResumeState(path, chunkPlan{size: 10000, unit: 3000, count: 4}, false)
+	state.MarkComplete(0)
+
+	if _, err := os.Stat(path); !os.IsNotExist(err) {
+		t.Fatalf("state file written with resume disabled: %v", err)
+	}
+}
+
+func TestOpenResumeStateNeedsPartFile(t *testing.T) {
+	plan := chunkPlan{size: 10000, unit: 3000, count: 4}
+
+	tests := []struct {
+		name     string
+		partSize int64 // -1 for no .part file
+		resumed  bool
+	}{
+		{"part file intact", 10000, true},
+		{"part file removed", -1, false},
+		{"part file truncated", 4000, false},
+	}
+	for _, tt := range tests {
+		t.Run(tt.name, func(t *testing.T) {
+			partPath := filepath.Join(t.TempDir(), "file.part")
+			state, _ := loadResumeState(partPath+".state", plan, true)
+			state.MarkComplete(0)
+			if tt.partSize >= 0 {
+				if err := os.WriteFile(partPath, make([]byte, tt.partSize), 0644); err != nil {
+					t.Fatal(err)
+				}
+			}
+
+			state, _ = openResumeState(partPath, plan.size, plan, true)
+			if got := state.IsComplete(0); got != tt.resumed {
+				t.Errorf("IsComplete(0) = %v, want %v", got, tt.resumed)
+			}
+			_, err := os.Stat(partPath + ".state")
+			if exists := err == nil; exists != tt.resumed {
+				t.Errorf("state file kept = %v, want %v", exists, tt.resumed)
+			}
+		})
+	}
+}
+
+func TestPlanChunks(t *testing.T) {
+	const MB = 1 << 20
+
+	tests := []struct {
+		name        string
+		size        int64
+		connections int
+		rate        float64
+		direct      bool
+		want        chunkPlan
+	}{
+		{"ChunksPerConn ranges per connection", 1024 * MB, 8, 0, false, chunkPlan{1024 * MB, 32 * MB, 32}},
+		{"no range below the minimum size", 10 * MB, 8, 0, false, chunkPlan{10 * MB, 5 * MB, 2}},
+		{"smaller than one minimum range", 1 * MB, 8, 0, false, chunkPlan{1 * MB, 1 * MB, 1}},
+		{"no range above MaxChunkSize", 64 * 1024 * MB, 4, 0, false, chunkPlan{64 * 1024 * MB, 64 * MB, 1024}},
+		{"direct I/O aligns the unit", 10*MB + 1000, 8, 0, true, chunkPlan{10*MB + 1000, 5 * MB, 2}},
+		{"rate sizes ranges to RangeDuration", 1024 * MB, 8, 10 * MB, false, chunkPlan{1024 * MB, 20648881, 52}},
+		{"slow rate clamped to the minimum size", 1024 * MB, 8, 100 * 1024, false, chunkPlan{1024 * MB, 4 * MB, 256}},
+		{"fast rate keeps a range per connection", 1024 * MB, 32, 1024 * MB, false, chunkPlan{1024 * MB, 32 * MB, 32}},
+	}
+	for _, tt := range tests {
+		t.Run(tt.name, func(t *testing.T) {
+			dm := &DownloadManager{config: &Config{DirectIO: tt.direct}}
+			if got := dm.planChunks(tt.size, tt.connections, tt.rate); got != tt.want {
+				t.Errorf("planChunks(%d, %d, %v) = %+v, want %+v", tt.size, tt.connections, tt.rate, got, tt.want)
+			}
+		})
+	}
+}
+
+func TestRetryDelay(t *testing.T) {
+	dm := &DownloadManager{config: &Config{RetryDelay: 2}}
+
+	tests := []struct {
+		name     string
+		retry    int
+		err      error
+		min, max time.Duration
+	}{
+		{"first retry", 0, errReadStalled, 2 * time.Second, 3 * time.Second},
+		{"backoff doubles", 2, errReadStalled, 8 * time.Second, 9 * time.Second},
+		{"backoff capped", 10, errReadStalled, MaxRetryDelay, MaxRetryDelay + time.Second},
+		{"Retry-After honoured", 0, &statusError{code: 429, retryAfter: 5 * time.Second}, 5 * time.Second, 5 * time.Second},
+		{"Retry-After capped", 0, &statusError{code: 503, retryAfter: 24 * time.Hour}, MaxRetryDelay, MaxRetryDelay},
+	}
+	for _, tt := range tests {
+		t.Run(tt.name, func(t *testing.T) {
+			if got := dm.retryDelay(tt.retry, tt.err); got < tt.min || got > tt.max {
+				t.Errorf("retryDelay(%d, %v) = %v, want between %v and %v", tt.retry, tt.err, got, tt.min, tt.max)
+			}
+		})
+	}
+
+	dm.config.RetryDelay = 0
+	if got := dm.retryDelay(3, errReadStalled); got != 0 {
+		t.Errorf("retryDelay with no configured delay = %v, want 0", got)
+	}
+}
+
+func TestNewStatusError(t *testing.T) {
+	inAnHour := time.Now().Add(time.Hour).UTC().Format(http.TimeFormat)
+
+	tests := []struct {
+		name       string
+		code       int
+		retryAfter string
+		min, max   time.Duration
+	}{
+		{"seconds", http.StatusTooManyRequests, "120", 120 * time.Second, 120 * time.Second},
+		{"HTTP date", http.StatusServiceUnavailable, inAnHour, 59 * time.Minute, time.Hour},
+		{"unparsable", http.StatusTooManyRequests, "soon", 0, 0},
+		{"ignored on other codes", http.StatusInternalServerError, "120", 0, 0},
+	}
+	for _, tt := range tests {
+		t.Run(tt.name, func(t *testing.T) {
+			resp := &http.Response{StatusCode: tt.code, Header: http.Header{"Retry-After": {tt.retryAfter}}}
+			var status *statusError
+			if !errors.As(newStatusError(resp), &status) {
+				t.Fatal("newStatusError did not return a *statusError")
+			}
+			if status.code != tt.code || status.retryAfter < tt.min || status.retryAfter > tt.max {
+				t.Errorf("got code %d, retryAfter %v; want code %d, retryAfter between %v and %v",
+					status.code, status.retryAfter, tt.code, tt.min, tt.max)
+			}
+		})
+	}
+
+	// A wait far beyond the cap must not park the workers
+	resp := &http.Response{StatusCode: http.StatusServiceUnavailable, Header: http.Header{"Retry-After": {"86400"}}}
+	dm := &DownloadManager{config: &Config{RetryDelay: 2}}
+	if got := dm.retryDelay(0, newStatusError(resp)); got != MaxRetryDelay {
+		t.Errorf("retryDelay for Retry-After: 86400 = %v, want %v", got, MaxRetryDelay)
+	}
+}
+
+func TestValidateURL(t *testing.T) {
+	tests := []struct {
+		url         string
+		valid       bool
+		validRemote bool
+	}{
+		{"https://example.com/file.iso", true, true},
+		{"http://example.com:8080/a/b?c=d", true, true},
+		{"file:///srv/mirror/file.iso", true, false},
+		{"FILE:///srv/mirror/file.iso", true, false},
+		{"http://", false, false},
+		{"file://", false, false},
+		{"ftp://example.com/file.iso", false, false},
+		{"example.com/file.iso", false, false},
+		{"http://[::1", false, false},
+		{"https://example.com/%zz", false, false},
+	}
+	for _, tt := range tests {
+		if err := validateURL(tt.url); (err == nil) != tt.valid {
+			t.Errorf("validateURL(%q) = %v, want valid %v", tt.url, err, tt.valid)
+		}
+		if err := validateRemoteURL(tt.url); (err == nil) != tt.validRemote {
+			t.Errorf("validateRemoteURL(%q) = %v, want valid %v", tt.url, err, tt.validRemote)
+		}
+	}
+}
+
+func TestCalculateHashes(t *testing.T) {
+	path := filepath.Join(t.TempDir(), "abc")
+	if err := os.WriteFile(path, []byte("abc"), 0644); err != nil {
+		t.Fatal(err)
+	}
+
+	sums, err := calculateHashes(path, []string{"sha256", "sha1", "md5"})
+	if err != nil {
+		t.Fatal(err)
+	}
+	want := map[string]string{
+		"sha256": "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad",
+		"sha1":   "a9993e364706816aba3e25717850c26c9cd0d89d",
+		"md5":    "900150983cd24fb0d6963f7d28e17f72",
+	}
+	for algorithm, sum := range want {
+		if sums[algorithm] != sum {
+			t.Errorf("%s = %s, want %s", algorithm, sums[algorithm], sum)
+		}
+	}
+
+	if _, err := calculateHashes(path, []string{"crc32"}); err == nil {
+		t.Error("calculateHashes accepted an unsupported algorithm")
+	}
+}